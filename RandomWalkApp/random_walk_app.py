@@ -1,31 +1,191 @@
 import streamlit as st
 import numpy as np
 import plotly.graph_objects as go
-import plotly.figure_factory as ff
-
-def simular_caminatas_aleatorias(num_simulaciones, num_pasos, valor_inicial, prob_subida, prob_bajada, prob_gran_subida):
-    todas_caminatas = []
-    for _ in range(num_simulaciones):
-        caminata = [valor_inicial]
-        for _ in range(num_pasos):
-            paso = caminata[-1]
-            rand = np.random.random()
-            if rand < prob_bajada:
-                paso = max(0, paso - 1)
-            elif rand < prob_bajada + prob_subida:
-                paso += 1
-            elif rand < prob_bajada + prob_subida + prob_gran_subida:
-                paso += np.random.randint(1, 7)
-            else:
-                paso = paso  # Sin cambio
-            caminata.append(paso)
-        todas_caminatas.append(caminata)
-    return np.array(todas_caminatas)
 
-def graficar_caminatas_aleatorias(caminatas, titulo):
+# Caminatas simuladas por bloque: limita la memoria con muchas simulaciones
+TAMANO_BLOQUE = 10000
+# Celdas máximas del mapa de densidad (valores x pasos) que se envían al navegador
+MAX_FILAS_DENSIDAD = 200
+MAX_COLUMNAS_DENSIDAD = 250
+
+def simular_caminatas_aleatorias(num_simulaciones, num_pasos, valor_inicial, prob_subida, prob_bajada, prob_gran_subida,
+                                 semilla=None):
+    """
+    Simula todas las caminatas a la vez: una matriz (simulaciones x pasos)
+    de resultados categóricos (bajar 1, subir 1, gran subida de 1 a 6, sin
+    cambio) y los saltos de las grandes subidas sorteados en bloque.
+
+    El piso en cero, x_t = max(0, x_{t-1} + paso_t), se resuelve sin bucles
+    con la reflexión de Lindley: con S_t la suma acumulada sin piso
+    (S_0 = valor_inicial), x_t = S_t - min(0, min_{k<=t} S_k).
+    Devuelve una matriz int32 (simulaciones x (pasos + 1)) que incluye el
+    valor inicial.
+    """
+    rng = np.random.default_rng(semilla)
+    rand = rng.random((num_simulaciones, num_pasos))
+    # 0: bajar, 1: subir, 2: gran subida, 3: sin cambio
+    categorias = (rand >= prob_bajada).astype(np.int8)
+    categorias += rand >= prob_bajada + prob_subida
+    categorias += rand >= prob_bajada + prob_subida + prob_gran_subida
+    saltos = rng.integers(1, 7, size=rand.shape, dtype=np.int8)
+    del rand
+
+    caminatas = np.empty((num_simulaciones, num_pasos + 1), dtype=np.int32)
+    caminatas[:, 0] = valor_inicial
+    caminatas[:, 1:] = np.where(categorias == 2, saltos, np.array([-1, 1, 0, 0], dtype=np.int8)[categorias])
+    np.cumsum(caminatas, axis=1, out=caminatas)
+    minimos = np.minimum.accumulate(caminatas, axis=1)
+    np.minimum(minimos, 0, out=minimos)
+    caminatas -= minimos
+    return caminatas
+
+def simular_resumen(num_simulaciones, num_pasos, valor_inicial, prob_subida, prob_bajada, prob_gran_subida,
+                    semilla=None, num_muestra=50, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Simula por bloques de tamano_bloque caminatas y guarda solo lo que se
+    grafica: los conteos de (valor, paso) para el mapa de densidad, los
+    valores finales y las primeras num_muestra caminatas. Cada bloque usa su
+    propio generador, derivado de `semilla` con SeedSequence.spawn.
+    """
+    tamanos = [min(tamano_bloque, num_simulaciones - inicio) for inicio in range(0, num_simulaciones, tamano_bloque)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    columnas = num_pasos + 1
+    conteos = np.zeros((0, columnas), dtype=np.int64)
+    # El bloque vacío inicial permite num_muestra = 0
+    finales, muestra = [], [np.empty((0, columnas), dtype=np.int32)]
+    for tamano, semilla_bloque in zip(tamanos, semillas):
+        caminatas = simular_caminatas_aleatorias(tamano, num_pasos, valor_inicial, prob_subida, prob_bajada,
+                                                 prob_gran_subida, semilla_bloque)
+        # Un solo bincount cuenta cada (valor, paso) del bloque
+        filas = int(caminatas.max()) + 1
+        indices = caminatas * columnas + np.arange(columnas)
+        bloque = np.bincount(indices.ravel(), minlength=filas * columnas).reshape(filas, columnas)
+        if filas > len(conteos):
+            conteos = np.vstack([conteos, np.zeros((filas - len(conteos), columnas), dtype=np.int64)])
+        conteos[:filas] += bloque
+        finales.append(caminatas[:, -1])
+        if sum(map(len, muestra)) < num_muestra:
+            muestra.append(caminatas[:num_muestra - sum(map(len, muestra))])
+    return {
+        'conteos': conteos,
+        'finales': np.concatenate(finales),
+        'muestra': np.vstack(muestra),
+    }
+
+def nucleo_de_paso(prob_subida, prob_bajada, prob_gran_subida):
+    """
+    Distribución de un paso como vector sobre los desplazamientos -1..6:
+    bajar, sin cambio, subir (o gran subida de 1) y grandes subidas de 2 a 6.
+    """
+    nucleo = np.full(8, prob_gran_subida / 6)
+    nucleo[0] = prob_bajada
+    nucleo[1] = 1 - prob_bajada - prob_subida - prob_gran_subida
+    nucleo[2] += prob_subida
+    return nucleo
+
+def probabilidades_de_primer_paso(num_pasos, valor_inicial, prob_subida, prob_bajada, prob_gran_subida, objetivo):
+    """
+    Probabilidades exactas, sin simular, de llegar a cero (ruina) y de llegar
+    al objetivo en cada paso. La distribución del valor se propaga como un
+    vector de probabilidades convolucionado con el núcleo de 8 desplazamientos
+    (np.convolve directo: con un núcleo tan corto es más barato que la FFT)
+    y la masa que cruza una barrera absorbente se retira del vector.
+
+    - Ruina: cero absorbente y sin techo.
+    - Objetivo: la dinámica de la aplicación (piso en cero) con el objetivo
+      absorbente.
+
+    Devuelve un dict con la probabilidad de primer paso en cada paso
+    (num_pasos + 1, empezando en el paso 0) para 'ruina' y 'objetivo'.
+    """
+    nucleo = nucleo_de_paso(prob_subida, prob_bajada, prob_gran_subida)
+    ruina = np.zeros(num_pasos + 1)
+    llegada = np.zeros(num_pasos + 1)
+
+    # Ruina: el vector cubre los valores 0..valor_inicial + 6 * pasos; el 0 queda vacío
+    if valor_inicial == 0:
+        ruina[0] = 1
+    else:
+        prob = np.zeros(valor_inicial + 1)
+        prob[valor_inicial] = 1
+        for paso in range(1, num_pasos + 1):
+            # El índice i de la convolución completa es el valor i - 1
+            prob = np.convolve(prob, nucleo)[1:]
+            ruina[paso] = prob[0]
+            prob[0] = 0
+
+    # Objetivo: el vector cubre los valores 0..objetivo - 1
+    if valor_inicial >= objetivo:
+        llegada[0] = 1
+    else:
+        prob = np.zeros(objetivo)
+        prob[valor_inicial] = 1
+        for paso in range(1, num_pasos + 1):
+            completa = np.convolve(prob, nucleo)
+            # Piso en cero: la masa que bajaría a -1 se queda en 0
+            completa[1] += completa[0]
+            llegada[paso] = completa[objetivo + 1:].sum()
+            prob = completa[1:objetivo + 1]
+
+    return {'ruina': ruina, 'objetivo': llegada}
+
+def graficar_primer_paso(primer_paso, objetivo):
+    """Probabilidad acumulada de primer paso por cero y por el objetivo"""
     fig = go.Figure()
-    for caminata in caminatas:
-        fig.add_trace(go.Scatter(y=caminata, mode='lines', opacity=0.3))
+    for clave, nombre in (('ruina', 'Llegar a 0 (ruina)'), ('objetivo', f'Llegar a {objetivo}')):
+        fig.add_trace(go.Scatter(y=np.cumsum(primer_paso[clave]), mode='lines', name=nombre))
+    fig.update_layout(
+        title='Probabilidad Exacta de Primer Paso',
+        xaxis_title='Número de Pasos',
+        yaxis_title='Probabilidad Acumulada',
+        yaxis_range=[0, 1]
+    )
+    return fig
+
+def reducir_conteos(conteos, max_filas=MAX_FILAS_DENSIDAD, max_columnas=MAX_COLUMNAS_DENSIDAD):
+    """
+    Suma bloques contiguos de valores y pasos para que el mapa de densidad
+    tenga a lo sumo max_filas x max_columnas celdas. Devuelve los conteos
+    reducidos y el ancho de cada bloque (valores, pasos).
+    """
+    ancho_filas = -(-conteos.shape[0] // max_filas)
+    ancho_columnas = -(-conteos.shape[1] // max_columnas)
+    filas = -(-conteos.shape[0] // ancho_filas) * ancho_filas
+    columnas = -(-conteos.shape[1] // ancho_columnas) * ancho_columnas
+    relleno = np.zeros((filas, columnas), dtype=conteos.dtype)
+    relleno[:conteos.shape[0], :conteos.shape[1]] = conteos
+    reducidos = relleno.reshape(filas // ancho_filas, ancho_filas, columnas // ancho_columnas, ancho_columnas)
+    return reducidos.sum(axis=(1, 3)), (ancho_filas, ancho_columnas)
+
+def graficar_densidad(conteos, titulo):
+    """Mapa de densidad (paso x valor): fracción de caminatas en cada celda"""
+    reducidos, (ancho_filas, ancho_columnas) = reducir_conteos(conteos)
+    # Cada bloque de pasos suma ancho_columnas pasos reales salvo el último,
+    # que puede estar completado con ceros: se divide por sus pasos reales
+    inicios = np.arange(reducidos.shape[1]) * ancho_columnas
+    pasos_reales = np.minimum(ancho_columnas, conteos.shape[1] - inicios)
+    fraccion = reducidos / (conteos[:, 0].sum() * pasos_reales)
+    fig = go.Figure(go.Heatmap(
+        x=inicios,
+        y=np.arange(reducidos.shape[0]) * ancho_filas,
+        z=np.where(fraccion > 0, fraccion, np.nan),
+        colorscale='Viridis',
+        colorbar=dict(title='Fracción'),
+        hovertemplate='Paso: %{x}<br>Valor: %{y}<br>Fracción: %{z:.4f}<extra></extra>'
+    ))
+    fig.update_layout(
+        title=titulo,
+        xaxis_title='Número de Pasos',
+        yaxis_title='Valor'
+    )
+    return fig
+
+def graficar_caminatas_aleatorias(caminatas, titulo):
+    """Caminatas de muestra en una sola traza WebGL, separadas por NaN"""
+    num_caminatas, columnas = caminatas.shape
+    x = np.tile(np.append(np.arange(columnas, dtype=float), np.nan), num_caminatas)
+    y = np.hstack([caminatas, np.full((num_caminatas, 1), np.nan)]).ravel()
+    fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines', opacity=0.3, line=dict(width=1)))
     fig.update_layout(
         title=titulo,
         xaxis_title='Número de Pasos',
@@ -34,13 +194,15 @@ def graficar_caminatas_aleatorias(caminatas, titulo):
     )
     return fig
 
-def graficar_distribucion_final(caminatas):
-    valores_finales = caminatas[:, -1]
-    fig = ff.create_distplot([valores_finales], ['Distribución'], bin_size=1, show_hist=False, show_rug=False)
+def graficar_distribucion_final(valores_finales):
+    """Distribución exacta de los valores finales enteros con np.bincount"""
+    frecuencias = np.bincount(valores_finales) / len(valores_finales)
+    fig = go.Figure(go.Bar(x=np.arange(len(frecuencias)), y=frecuencias))
     fig.update_layout(
         title='Distribución de Valores Finales',
         xaxis_title='Valor Final',
-        yaxis_title='Densidad'
+        yaxis_title='Probabilidad',
+        bargap=0
     )
     return fig
 
@@ -51,9 +213,12 @@ def main():
 
     # Barra lateral para entradas del usuario
     st.sidebar.header('Parámetros de Simulación')
-    num_simulaciones = st.sidebar.slider('Número de Simulaciones', 10, 1000, 100)
+    num_simulaciones = st.sidebar.slider('Número de Simulaciones', 10, 100000, 1000)
     num_pasos = st.sidebar.slider('Número de Pasos', 10, 1000, 100)
     valor_inicial = st.sidebar.number_input('Valor Inicial', 0, 1000, 0)
+    objetivo = st.sidebar.number_input('Valor Objetivo', 1, 10000, 50)
+    num_muestra = st.sidebar.slider('Caminatas de Muestra en el Gráfico', 0, 500, 50)
+    semilla = st.sidebar.number_input('Semilla', 0, value=42)
     
     st.sidebar.header('Parámetros de Probabilidad')
     prob_bajada = st.sidebar.slider('Probabilidad de Bajar', 0.0, 1.0, 0.3)
@@ -70,19 +235,26 @@ def main():
 
     # Ejecutar simulación
     if st.button('Ejecutar Simulación'):
-        caminatas = simular_caminatas_aleatorias(num_simulaciones, num_pasos, valor_inicial, prob_subida, prob_bajada, prob_gran_subida)
+        with st.spinner('Simulando caminatas...'):
+            resumen = simular_resumen(num_simulaciones, num_pasos, valor_inicial, prob_subida, prob_bajada,
+                                      prob_gran_subida, semilla=int(semilla), num_muestra=num_muestra)
 
-        # Gráfico de caminatas aleatorias
-        fig_caminatas = graficar_caminatas_aleatorias(caminatas, 'Simulaciones de Caminata Aleatoria')
-        st.plotly_chart(fig_caminatas, use_container_width=True)
+        # Mapa de densidad de todas las caminatas
+        fig_densidad = graficar_densidad(resumen['conteos'], 'Densidad de las Caminatas por Paso')
+        st.plotly_chart(fig_densidad, use_container_width=True)
+
+        # Gráfico de caminatas de muestra
+        if num_muestra > 0:
+            fig_caminatas = graficar_caminatas_aleatorias(resumen['muestra'], 'Simulaciones de Caminata Aleatoria')
+            st.plotly_chart(fig_caminatas, use_container_width=True)
 
         # Gráfico de distribución final
-        fig_dist = graficar_distribucion_final(caminatas)
+        fig_dist = graficar_distribucion_final(resumen['finales'])
         st.plotly_chart(fig_dist, use_container_width=True)
 
         # Estadísticas
         st.subheader('Estadísticas de la Simulación')
-        valores_finales = caminatas[:, -1]
+        valores_finales = resumen['finales']
         col1, col2 = st.columns(2)
         with col1:
             st.write(f'Valor final medio: {valores_finales.mean():.2f}')
@@ -92,5 +264,25 @@ def main():
             st.write(f'Valor final mínimo: {valores_finales.min():.2f}')
             st.write(f'Valor final máximo: {valores_finales.max():.2f}')
 
+        # Primer paso y ruina, exactos
+        st.subheader('Probabilidades de Primer Paso (Exactas)')
+        primer_paso = probabilidades_de_primer_paso(num_pasos, valor_inicial, prob_subida, prob_bajada,
+                                                    prob_gran_subida, objetivo)
+        st.plotly_chart(graficar_primer_paso(primer_paso, objetivo), use_container_width=True)
+        col1, col2 = st.columns(2)
+        for columna, clave, nombre in ((col1, 'ruina', 'llegar a 0'), (col2, 'objetivo', f'llegar a {objetivo}')):
+            probabilidad = primer_paso[clave]
+            total = probabilidad.sum()
+            with columna:
+                st.write(f'Probabilidad de {nombre} en {num_pasos} pasos: {total:.2%}')
+                if total > 0:
+                    pasos = np.arange(num_pasos + 1)
+                    mediana = np.searchsorted(np.cumsum(probabilidad), total / 2)
+                    st.write(f'Tiempo medio de primer paso (si ocurre): {(pasos * probabilidad).sum() / total:.1f}')
+                    st.write(f'Tiempo mediano de primer paso (si ocurre): {mediana}')
+        st.write('Calculadas propagando la distribución del valor paso a paso con barreras absorbentes, '
+                 'sin ruido de muestreo. La ruina trata el cero como absorbente; la llegada al objetivo '
+                 'usa la misma dinámica que la simulación (piso en cero).')
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,105 +1,114 @@
 import streamlit as st
-import yfinance as yf
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
 import os
 import sys
+import time
 from pathlib import Path
 
 # Asegurar que streamlit pueda encontrar el módulo
 file_path = Path(__file__).parent.absolute()
 sys.path.append(str(file_path))
 
-def get_stock_data(ticker):
-    """Obtiene datos del activo desde Yahoo Finance"""
-    stock = yf.Ticker(ticker)
-    current_price = stock.info['regularMarketPrice']
-    return current_price, stock
-
-def calculate_factors(volatility, delta_t):
-    """Calcula los factores u y d del modelo binomial"""
-    u = np.exp(volatility * np.sqrt(delta_t))
-    d = 1/u
-    return u, d
-
-def calculate_risk_neutral_probability(r, u, d, delta_t):
-    """Calcula la probabilidad neutral al riesgo"""
-    p = (np.exp(r * delta_t) - d) / (u - d)
-    return p
-
-def create_price_tree(S0, u, d, steps):
-    """Crea el árbol de precios"""
-    tree = np.zeros((steps + 1, steps + 1))
-    for i in range(steps + 1):
-        for j in range(i + 1):
-            tree[j, i] = S0 * (u ** (i - j)) * (d ** j)
-    return tree
-
-def create_option_tree(price_tree, K, r, p, delta_t, steps, option_type='call', american=False):
-    """Crea el árbol de valores de la opción"""
-    option_tree = np.zeros((steps + 1, steps + 1))
-    
-    # Valores finales
-    if option_type.lower() == 'call':
-        option_tree[:, steps] = np.maximum(price_tree[:, steps] - K, 0)
-    else:  # put
-        option_tree[:, steps] = np.maximum(K - price_tree[:, steps], 0)
-    
-    # Retroceder en el árbol
-    for i in range(steps-1, -1, -1):
-        for j in range(i + 1):
-            hold_value = np.exp(-r * delta_t) * (
-                p * option_tree[j, i + 1] + 
-                (1 - p) * option_tree[j + 1, i + 1]
-            )
-            
-            if american:
-                if option_type.lower() == 'call':
-                    exercise_value = price_tree[j, i] - K
-                else:  # put
-                    exercise_value = K - price_tree[j, i]
-                option_tree[j, i] = max(hold_value, exercise_value)
-            else:
-                option_tree[j, i] = hold_value
-                
-    return option_tree
+from binomial_engine import (
+    LATTICE_MODELS,
+    MIN_GREEK_STEPS,
+    lattice_parameters,
+    create_price_tree,
+    create_option_tree,
+    price_options_batch,
+    convergence_table,
+)
+from option_engines import compare_engines
+from quote_providers import QUOTE_PROVIDERS, get_quote
+
+# Por encima de este tamaño no se materializan los árboles completos
+MAX_TREE_STEPS = 1000
+
+# Filas y columnas máximas de las tablas de los árboles que se envían al navegador
+MAX_TABLE_SIZE = 51
+
+# Segundos que se reutiliza un precio antes de volver a pedirlo
+QUOTE_TTL = 60
+
+@st.cache_data(ttl=QUOTE_TTL, show_spinner=False)
+def get_stock_data(ticker, provider='Yahoo Finance', source=None, source_mtime=None):
+    """
+    Obtiene el precio actual del activo, cacheado por ticker y fuente.
+
+    Los cambios en strike, pasos u otros inputs que no son de mercado no
+    vuelven a consultar al proveedor. source_mtime solo forma parte de la
+    clave de caché, para releer un snapshot local cuando cambia el archivo.
+    """
+    return get_quote(ticker, provider, source)
+
+def parse_schedule(text):
+    """Convierte 'días:valor, días:valor' en una lista de pares (días, valor)"""
+    pairs = []
+    for item in text.split(','):
+        if item.strip():
+            day, value = item.split(':')
+            pairs.append((float(day), float(value)))
+    return pairs
+
+def sample_indices(count, budget):
+    """Hasta `budget` índices equiespaciados de range(count), incluyendo extremos"""
+    if count <= budget:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, budget).round().astype(int))
+
+def tree_table(tree, budget=MAX_TABLE_SIZE):
+    """
+    Tabla de un árbol (nodos x pasos) submuestreada a lo sumo a budget x budget
+    celdas con sample_indices; los índices conservan el nodo y el paso reales.
+    """
+    rows = sample_indices(tree.shape[0], budget)
+    columns = sample_indices(tree.shape[1], budget)
+    return pd.DataFrame(tree[np.ix_(rows, columns)], index=rows, columns=columns)
+
+def plot_trees(price_tree, option_tree, steps, label_layers=3,
+               max_layers=60, max_nodes_per_layer=60):
+    """
+    Crea visualizaciones de los árboles usando plotly.
 
-def plot_trees(price_tree, option_tree, steps):
-    """Crea visualizaciones de los árboles usando plotly"""
-    def create_node_trace(x, y, values, name):
+    Cada árbol es una única traza. Solo las primeras y últimas `label_layers`
+    capas llevan etiqueta (el resto muestra el valor al pasar el mouse) y con
+    muchos pasos se submuestrean capas y nodos hasta el presupuesto indicado.
+    """
+    layers = sample_indices(steps + 1, max_layers)
+    x, y = [], []
+    for i in layers:
+        nodes = sample_indices(i + 1, max_nodes_per_layer)
+        x.append(np.full(nodes.size, i))
+        y.append(nodes)
+    x, y = np.concatenate(x), np.concatenate(y)
+    
+    # Etiquetas solo en las primeras y últimas capas mostradas
+    labelled = np.isin(x, np.concatenate([layers[:label_layers], layers[-label_layers:]]))
+    
+    def create_node_trace(y_values, values, name):
         return go.Scatter(
-            x=x, y=y,
+            x=x, y=y_values,
             mode='markers+text',
             name=name,
-            text=[f'{v:.2f}' for v in values],
+            text=np.where(labelled, np.char.mod('%.2f', values), ''),
             textposition='top center',
-            marker=dict(size=10)
+            customdata=np.column_stack([y, values]),
+            hovertemplate='Paso %{x}, nodo %{customdata[0]}: %{customdata[1]:.2f}',
+            marker=dict(size=10 if steps <= 20 else 5)
         )
-
+    
     fig = go.Figure()
+    fig.add_trace(create_node_trace(y, price_tree[y, x], 'Precio'))
+    fig.add_trace(create_node_trace(-y - 2, option_tree[y, x], 'Opción'))
     
-    for i in range(steps + 1):
-        x = [i] * (i + 1)
-        y = list(range(i + 1))
-        
-        # Añadir nodos de precio
-        fig.add_trace(create_node_trace(
-            x, y,
-            price_tree[:i+1, i],
-            f'Precio paso {i}'
-        ))
-        
-        # Añadir nodos de opción
-        fig.add_trace(create_node_trace(
-            x, [-y_ - 2 for y_ in y],
-            option_tree[:i+1, i],
-            f'Opción paso {i}'
-        ))
-
+    title = 'Árboles de Precio y Valor de la Opción'
+    if layers.size < steps + 1 or y.size < (steps + 1) * (steps + 2) // 2:
+        title += f' (submuestreado a {y.size} nodos)'
     fig.update_layout(
-        title='Árboles de Precio y Valor de la Opción',
+        title=title,
         showlegend=True,
         height=800
     )
@@ -114,8 +123,16 @@ col1, col2 = st.columns(2)
 
 with col1:
     ticker = st.text_input('Símbolo del activo (ej: GGAL)', 'GGAL')
+    provider = st.selectbox('Fuente de precios', 
+                           list(QUOTE_PROVIDERS))
+    source, source_mtime = None, None
+    if provider == 'Snapshot local':
+        source = st.text_input('Archivo de snapshot (CSV o Parquet con columnas ticker, price)', 
+                              'quotes.csv')
+        if os.path.exists(source):
+            source_mtime = os.path.getmtime(source)
     try:
-        current_price, stock = get_stock_data(ticker)
+        current_price = get_stock_data(ticker, provider, source, source_mtime)
         st.success(f'Precio actual de {ticker}: ${current_price:.2f}')
     except:
         st.error('Error al obtener datos. Verifica el símbolo.')
@@ -140,7 +157,7 @@ with col2:
     
     steps = st.number_input('Número de pasos', 
                            min_value=1, 
-                           max_value=50,
+                           max_value=20000,
                            value=5)
     
     option_type = st.selectbox('Tipo de opción', 
@@ -148,50 +165,201 @@ with col2:
     
     american = st.checkbox('Opción Americana', 
                           value=False)
+    
+    model = st.selectbox('Modelo del retículo', 
+                        LATTICE_MODELS)
+    
+    compute_greeks = st.checkbox('Calcular griegas', 
+                                value=False,
+                                help='Delta, gamma, theta, vega y rho en la misma inducción; '
+                                     'con opciones americanas cuesta unas tres veces más que solo el precio')
+    
+    show_trees = st.checkbox('Mostrar árboles', 
+                            value=steps <= MAX_TREE_STEPS)
+
+# Dividendos y estructura temporal de tasas
+with st.expander('Dividendos y curva de tasas'):
+    dividend_yield = st.number_input('Dividendo continuo (% anual)', 
+                                    min_value=0.0, 
+                                    value=0.0) / 100
+    cash_input = st.text_input('Dividendos en efectivo (días:monto, ...)', '')
+    yield_input = st.text_input('Dividendos proporcionales (días:%, ...)', '')
+    curve_input = st.text_input('Curva de tasas cero (días:tasa %, ...); vacía = tasa plana', '')
+    
+    try:
+        dividends = ([(day, amount, 'cash') for day, amount in parse_schedule(cash_input)] +
+                     [(day, pct / 100, 'yield') for day, pct in parse_schedule(yield_input)])
+        rate_curve = [(day, rate / 100) for day, rate in parse_schedule(curve_input)] or None
+    except ValueError:
+        st.error('Formato inválido: usa pares días:valor separados por coma.')
+        dividends, rate_curve = [], None
+
+market_inputs = dict(dividend_yield=dividend_yield, dividends=dividends, rate_curve=rate_curve)
 
 if st.button('Calcular'):
-    # Cálculos
-    delta_t = time_to_expiry / 365 / steps
-    u, d = calculate_factors(volatility, delta_t)
-    p = calculate_risk_neutral_probability(risk_free_rate, u, d, delta_t)
-    
-    # Crear árboles
-    price_tree = create_price_tree(current_price, u, d, steps)
-    option_tree = create_option_tree(
-        price_tree, strike, risk_free_rate, p, delta_t, 
-        steps, option_type, american
+    # Cálculos con los mismos pasos que usa el precio (Leisen-Reimer los lleva a impar)
+    lattice_steps = steps + 1 if model == 'Leisen-Reimer' and steps % 2 == 0 else steps
+    delta_t = time_to_expiry / 365 / lattice_steps
+    u, d, p = lattice_parameters(
+        model, current_price, strike, volatility, risk_free_rate,
+        time_to_expiry / 365, lattice_steps
     )
     
-    # Mostrar resultado
-    option_price = option_tree[0, 0]
-    st.success(f'Precio de la opción: ${option_price:.2f}')
+    # Valuar la opción (y sus griegas) sin materializar el árbol completo
+    greeks = compute_greeks and steps >= MIN_GREEK_STEPS[model]
+    start = time.perf_counter()
+    try:
+        result = price_options_batch(
+            current_price, strike, time_to_expiry, volatility, option_type,
+            risk_free_rate, steps, american, greeks=greeks,
+            model=model, **market_inputs
+        ).iloc[0]
+    except ValueError as error:
+        st.error(f'No se pudo valuar la opción: {error}')
+        result = None
+    elapsed = time.perf_counter() - start
+    
+    if result is not None:
+        option_price = result['Precio']
     
-    # Mostrar parámetros calculados
-    st.write('### Parámetros del modelo')
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.write(f'Factor u: {u:.4f}')
-    with col2:
-        st.write(f'Factor d: {d:.4f}')
-    with col3:
-        st.write(f'Probabilidad p: {p:.4f}')
+        # Mostrar resultado
+        st.success(f'Precio de la opción: ${option_price:.2f}')
+        st.caption(f'Calculado en {elapsed * 1000:.1f} ms con {steps} pasos ({model})')
+        if lattice_steps != steps:
+            st.caption(f'Leisen-Reimer usa un número impar de pasos: se valuó con {lattice_steps}.')
+        if model == 'Richardson' and steps < 2:
+            st.caption('Richardson necesita al menos 2 pasos: se valuó con BBS.')
     
-    # Visualización
-    fig = plot_trees(price_tree, option_tree, steps)
-    st.plotly_chart(fig)
+        if greeks:
+            st.write('### Griegas')
+            greek_cols = st.columns(5)
+            for col, greek in zip(greek_cols, ['Delta', 'Gamma', 'Theta', 'Vega', 'Rho']):
+                col.metric(greek, f'{result[greek]:.4f}')
+            st.caption('Theta por día; vega y rho por punto porcentual.')
+        elif compute_greeks:
+            st.info(f'Las griegas requieren al menos {MIN_GREEK_STEPS[model]} pasos con {model}.')
     
-    # Mostrar árboles en formato tabular
-    st.write('### Árbol de precios del activo')
-    st.dataframe(pd.DataFrame(price_tree))
+        # Mostrar parámetros calculados
+        st.write('### Parámetros del modelo')
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.write(f'Factor u: {u:.4f}')
+        with col2:
+            st.write(f'Factor d: {d:.4f}')
+        with col3:
+            st.write(f'Probabilidad p: {p:.4f}')
     
-    st.write('### Árbol de valores de la opción')
-    st.dataframe(pd.DataFrame(option_tree))
+        # Visualización
+        if show_trees and lattice_steps > MAX_TREE_STEPS:
+            st.warning(f'Los árboles solo se muestran con hasta {MAX_TREE_STEPS} pasos.')
+        elif show_trees:
+            price_tree = create_price_tree(current_price, u, d, lattice_steps)
+            option_tree = create_option_tree(
+                price_tree, strike, risk_free_rate, p, delta_t, 
+                lattice_steps, option_type, american
+            )
+        
+            fig = plot_trees(price_tree, option_tree, lattice_steps)
+            st.plotly_chart(fig)
+            if dividends or rate_curve:
+                st.caption('Los árboles se dibujan con tasa plana y sin dividendos discretos.')
+        
+            # Mostrar árboles en formato tabular
+            st.write('### Árbol de precios del activo')
+            st.dataframe(tree_table(price_tree))
+        
+            st.write('### Árbol de valores de la opción')
+            st.dataframe(tree_table(option_tree))
+            if lattice_steps + 1 > MAX_TABLE_SIZE:
+                st.caption(f'Tablas submuestreadas a {MAX_TABLE_SIZE} nodos y {MAX_TABLE_SIZE} pasos '
+                           'equiespaciados (filas: nodo, columnas: paso).')
+
+# Valoración de una cadena completa
+with st.expander('Valoración por lotes (cadena de opciones)'):
+    strikes_input = st.text_input('Strikes (separados por coma)', 
+                                 f'{current_price * 0.9:.2f}, {current_price:.2f}, {current_price * 1.1:.2f}')
+    expiries_input = st.text_input('Vencimientos en días (separados por coma)', 
+                                  '30, 60, 90')
+    batch_types = st.multiselect('Tipos', ['Call', 'Put'], 
+                                default=['Call', 'Put'])
+    
+    if st.button('Valuar cadena'):
+        try:
+            chain_strikes = [float(x) for x in strikes_input.split(',')]
+            chain_days = [int(x) for x in expiries_input.split(',')]
+        except ValueError:
+            st.error('Strikes y vencimientos deben ser números separados por coma.')
+            chain_strikes = []
+        
+        if chain_strikes and not batch_types:
+            st.warning('Selecciona al menos un tipo de opción.')
+        elif chain_strikes:
+            # Grilla completa strike x vencimiento x tipo
+            grid_strikes, grid_days, grid_types = np.meshgrid(
+                chain_strikes, chain_days, batch_types, indexing='ij'
+            )
+            start = time.perf_counter()
+            try:
+                chain = price_options_batch(
+                    current_price, grid_strikes, grid_days, volatility, grid_types,
+                    risk_free_rate, steps, american, model=model, **market_inputs
+                )
+            except ValueError as error:
+                st.error(f'No se pudo valuar la cadena: {error}')
+            else:
+                elapsed = time.perf_counter() - start
+                st.caption(f'{len(chain)} contratos valuados en {elapsed * 1000:.1f} ms')
+                st.dataframe(chain)
+
+# Convergencia de cada modelo frente a Black-Scholes
+with st.expander('Convergencia frente a Black-Scholes'):
+    st.write('Compara error y tiempo de cada modelo para la versión europea del contrato.')
+    
+    if st.button('Comparar modelos'):
+        try:
+            convergence, reference = convergence_table(
+                current_price, strike, risk_free_rate, volatility, time_to_expiry,
+                option_type, [25, 50, 100, 200, 400, 800]
+            )
+        except ValueError as error:
+            st.error(f'No se pudo armar la tabla de convergencia: {error}')
+        else:
+            st.write(f'Precio Black-Scholes de referencia: ${reference:.4f}')
+            st.dataframe(convergence.style.format({
+                'Precio': '{:.4f}',
+                'Error': '{:.2e}',
+                'Tiempo (ms)': '{:.2f}',
+            }))
+
+# Comparación de métodos numéricos
+with st.expander('Comparar métodos numéricos'):
+    st.write('Binomial, trinomial y Crank-Nicolson (penalización para americanas).')
+    engine_steps = st.number_input('Pasos para la comparación', 
+                                  min_value=10, 
+                                  max_value=2000,
+                                  value=200)
+    
+    if st.button('Comparar métodos'):
+        try:
+            comparison = compare_engines(
+                current_price, strike, risk_free_rate, volatility,
+                time_to_expiry / 365, engine_steps, option_type, american
+            )
+        except ValueError as error:
+            st.error(f'No se pudieron comparar los métodos: {error}')
+        else:
+            st.dataframe(comparison.style.format({
+                'Precio': '{:.4f}',
+                'Tiempo (ms)': '{:.2f}',
+                'Nodos': '{:,}',
+            }))
 
 st.markdown("""
 ### Notas:
-- Los precios se obtienen en tiempo real de Yahoo Finance
+- Los precios se obtienen de Yahoo Finance o de un snapshot local y se reutilizan durante 60 segundos
 - La volatilidad debe ingresarse como porcentaje anual
 - La tasa libre de riesgo debe ingresarse como porcentaje anual
 - El tiempo hasta el vencimiento se ingresa en días
+- Los dividendos en efectivo siguen el modelo escrowed (se descuenta su valor presente del precio inicial)
 - Los árboles muestran tanto los precios del activo como los valores de la opción en cada nodo
 """)
\ No newline at end of file
@@ -0,0 +1,657 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+LATTICE_MODELS = ['CRR', 'Tian', 'Leisen-Reimer', 'BBS', 'Richardson']
+
+# Pasos de las diferencias centrales sobre las entradas del retículo para
+# vega y rho (sigma, r). Deben ser chicos: el error de la derivada del precio
+# de los nodos extremos crece con steps y se arrastra a las capas anteriores.
+TANGENT_STEPS = {'vol': 1e-5, 'rate': 1e-6}
+
+# Pasos mínimos para leer las griegas de las capas 1 y 2 en cada modelo
+MIN_GREEK_STEPS = {'CRR': 2, 'Tian': 2, 'Leisen-Reimer': 2, 'BBS': 3, 'Richardson': 6}
+
+
+def calculate_factors(volatility, delta_t):
+    """Calcula los factores u y d del modelo binomial"""
+    u = np.exp(volatility * np.sqrt(delta_t))
+    d = 1/u
+    return u, d
+
+def calculate_risk_neutral_probability(r, u, d, delta_t):
+    """Calcula la probabilidad neutral al riesgo"""
+    p = (np.exp(r * delta_t) - d) / (u - d)
+    return p
+
+def tian_factors(volatility, r, delta_t):
+    """Factores de Tian: igualan los tres primeros momentos del lognormal"""
+    growth = np.exp(r * delta_t)
+    v = np.exp(volatility ** 2 * delta_t)
+    root = np.sqrt(v ** 2 + 2 * v - 3)
+    u = 0.5 * growth * v * (v + 1 + root)
+    d = 0.5 * growth * v * (v + 1 - root)
+    return u, d
+
+def peizer_pratt(z, steps):
+    """Inversión de Peizer-Pratt (método 2) de la normal acumulada"""
+    a = z / (steps + 1 / 3 + 0.1 / (steps + 1))
+    return 0.5 + np.sign(z) * 0.5 * np.sqrt(1 - np.exp(-a ** 2 * (steps + 1 / 6)))
+
+def leisen_reimer_factors(S0, K, volatility, r, T, steps):
+    """Factores u, d y probabilidad p de Leisen-Reimer (steps debe ser impar)"""
+    d1 = (np.log(S0 / K) + (r + volatility ** 2 / 2) * T) / (volatility * np.sqrt(T))
+    d2 = d1 - volatility * np.sqrt(T)
+    growth = np.exp(r * T / steps)
+    p = peizer_pratt(d2, steps)
+    u = growth * peizer_pratt(d1, steps) / p
+    d = (growth - p * u) / (1 - p)
+    return u, d, p
+
+def lattice_parameters(model, S0, K, volatility, r, T, steps):
+    """Factores u, d y probabilidad p del retículo según el modelo elegido"""
+    delta_t = T / steps
+    if model == 'Leisen-Reimer':
+        return leisen_reimer_factors(S0, K, volatility, r, T, steps)
+    if model == 'Tian':
+        u, d = tian_factors(volatility, r, delta_t)
+    else:  # CRR, también base del BBS
+        u, d = calculate_factors(volatility, delta_t)
+    return u, d, calculate_risk_neutral_probability(r, u, d, delta_t)
+
+def black_scholes(S, K, r, volatility, T, sign, q=0.0):
+    """Precio Black-Scholes europeo (sign = +1 call, -1 put; q = dividendo continuo)"""
+    vol_sqrt_t = volatility * np.sqrt(T)
+    d1 = (np.log(S / K) + (r - q + volatility ** 2 / 2) * T) / vol_sqrt_t
+    d2 = d1 - vol_sqrt_t
+    return sign * (S * np.exp(-q * T) * norm.cdf(sign * d1) -
+                   K * np.exp(-r * T) * norm.cdf(sign * d2))
+
+def market_schedule(S0, T, steps, rate_curve, dividends=(), rate_shift=0.0):
+    """
+    Arrays por paso del retículo que dependen del mercado, calculados una vez.
+
+    rate_curve es una lista de (días, tasa cero) interpolada linealmente en
+    días; rate_shift la desplaza en paralelo. dividends es una lista de
+    (días, monto, tipo), con tipo 'cash' (monto en $) o 'yield' (fracción
+    del precio). Devuelve un dict con:
+    - rates: tasa forward de cada uno de los `steps` pasos
+    - zero_rate: tasa cero al vencimiento
+    - spot: S0 neto del valor presente de los dividendos en efectivo
+      (modelo escrowed), punto de partida del retículo
+    - scale, shift: el precio real en la capa i es S * scale[i] + shift[i];
+      scale acumula los dividendos proporcionales ya pagados y shift es el
+      valor presente de los dividendos en efectivo pendientes
+    """
+    curve_days, curve_rates = (np.asarray(x, dtype=float) for x in zip(*rate_curve))
+
+    def discount_factor(t):
+        return np.exp(-(np.interp(t * 365, curve_days, curve_rates) + rate_shift) * t)
+
+    times = np.linspace(0, T, steps + 1)
+    step_discount = discount_factor(times)
+    rates = -np.diff(np.log(step_discount)) / (T / steps)
+
+    shift = np.zeros(steps + 1)
+    scale = np.ones(steps + 1)
+    for day, amount, kind in dividends:
+        t_div = day / 365
+        if not 0 < t_div <= T:
+            continue
+        if kind == 'cash':
+            pending = times < t_div
+            shift[pending] += amount * discount_factor(t_div) / step_discount[pending]
+        else:
+            scale[times >= t_div] *= 1 - amount
+
+    return {
+        'rates': rates,
+        'zero_rate': -np.log(step_discount[-1]) / T,
+        'spot': S0 - shift[0],
+        'scale': scale,
+        'shift': shift,
+    }
+
+def create_price_tree(S0, u, d, steps, layout='full'):
+    """
+    Crea el árbol de precios con S0 * u**(i-j) * d**j sin bucles por nodo.
+
+    layout:
+    - 'full': matriz cuadrada (steps+1, steps+1), con ceros bajo la diagonal
+    - 'terminal': solo la capa final (steps+1,)
+    - 'packed': vector triangular donde la capa i empieza en i*(i+1)//2
+    """
+    if layout == 'terminal':
+        # Con u y d vectoriales devuelve una columna por retículo
+        downs = np.arange(steps + 1)
+        return S0 * np.exp(np.multiply.outer(steps - downs, np.log(u)) +
+                           np.multiply.outer(downs, np.log(d)))
+
+    if layout == 'packed':
+        layer, downs = packed_indices(steps)
+        return S0 * np.exp((layer - downs) * np.log(u) + downs * np.log(d))
+
+    if layout != 'full':
+        raise ValueError(f"Formato de árbol desconocido: {layout}")
+
+    # Producto exterior de potencias: tree[j, i] = S0 * u**i * (d/u)**j
+    n = np.arange(steps + 1)
+    tree = S0 * np.outer((d / u) ** n, u ** n)
+    return np.triu(tree)
+
+def packed_indices(steps):
+    """Capa i y número de bajadas j de cada posición del formato 'packed'"""
+    layer = np.repeat(np.arange(steps + 1), np.arange(1, steps + 2))
+    downs = np.arange(layer.size) - layer * (layer + 1) // 2
+    return layer, downs
+
+def payoff(prices, K, option_type='call'):
+    """Valor de ejercicio de la opción para un vector de precios"""
+    if option_type.lower() == 'call':
+        return np.maximum(prices - K, 0)
+    return np.maximum(K - prices, 0)
+
+def option_sign(option_type):
+    """+1 para calls y -1 para puts, de modo que payoff = max(sign * (S - K), 0)"""
+    return 1.0 if option_type.lower() == 'call' else -1.0
+
+def terminal_weights(p, steps):
+    """Probabilidades binomiales de cada nodo terminal (calculadas en log)"""
+    j = np.arange(1, steps + 1)
+    log_comb = np.concatenate(([0.0], np.cumsum(np.log((steps - j + 1) / j))))
+    downs = np.arange(steps + 1)
+    return np.exp(log_comb[:, None] +
+                  np.multiply.outer(steps - downs, np.log(p)) +
+                  np.multiply.outer(downs, np.log1p(-p)))
+
+def value_lattices(terminal_prices, lattice_idx, K, sign, u, p, discount, steps,
+                   american=False, return_layers=False, terminal_values=None,
+                   price_adjust=None, tangents=()):
+    """
+    Valúa varios contratos a la vez, uno por columna.
+
+    terminal_prices tiene una columna por retículo distinto y lattice_idx
+    indica qué retículo usa cada contrato, de modo que los contratos con el
+    mismo (S0, sigma, r, T, steps) comparten precios y probabilidades.
+    u, p y discount son los parámetros de cada retículo; K y sign, los de
+    cada contrato. p y discount pueden ser arrays (steps, retículos) con un
+    valor por paso (curva de tasas, dividendos).
+
+    Las europeas con p constante se valúan en O(steps) como esperanza
+    descontada sobre la capa terminal. El resto hace la inducción hacia atrás
+    sobre un único buffer, con una operación vectorizada de NumPy por paso.
+
+    Con return_layers=True devuelve además los valores de las capas 1 y 2,
+    de donde se leen delta, gamma y theta. terminal_values reemplaza al
+    payoff en la última capa (lo usa el modelo BBS). price_adjust es un par
+    (scale, shift) de arrays (steps + 1, retículos): el precio real del nodo
+    es S * scale[i] + shift[i] (ver market_schedule).
+
+    tangents es una lista de derivativas de las entradas respecto de un
+    parámetro (ver lattice_tangent); cada una se propaga junto con los
+    valores en la misma inducción (diferenciación en modo forward), sobre
+    los mismos nodos, y su derivada en la raíz se agrega al final del
+    resultado como una lista. Lanza ValueError si alguna probabilidad p no
+    está en (0, 1).
+    """
+    if return_layers and steps < 2:
+        raise ValueError("Se necesitan al menos 2 pasos para leer las capas 1 y 2")
+    if not np.all((p > 0) & (p < 1)):
+        # Con p fuera de (0, 1) el retículo admite arbitraje, para europeas y americanas por igual
+        raise ValueError("La probabilidad neutral al riesgo p queda fuera de (0, 1): "
+                         "aumenta la cantidad de pasos o la volatilidad")
+
+    # Con un contrato por retículo, en orden, los precios no hace falta reordenarlos
+    one_per_lattice = np.array_equal(lattice_idx, np.arange(terminal_prices.shape[1]))
+
+    def node_prices(i, prices):
+        """Precio real del activo en los nodos de la capa i"""
+        if price_adjust is None:
+            return prices if one_per_lattice else prices[:, lattice_idx]
+        scale, shift = price_adjust
+        return prices[:, lattice_idx] * scale[i, lattice_idx] + shift[i, lattice_idx]
+
+    if terminal_values is None:
+        values = np.maximum(sign * (node_prices(steps, terminal_prices) - K), 0)
+    else:
+        values = terminal_values.copy()
+    per_step = np.ndim(p) == 2
+    up = (discount * p)[..., lattice_idx]
+    down = (discount * (1 - p))[..., lattice_idx]
+
+    if not american and not per_step and not tangents:
+        if not return_layers:
+            weights = terminal_weights(p, steps)[:, lattice_idx]
+            return discount[lattice_idx] ** steps * np.sum(weights * values, axis=0)
+
+        # Esperanza desde cada nodo de la capa 2 y dos pasos hacia atrás
+        remaining = steps - 2
+        weights = terminal_weights(p, remaining)[:, lattice_idx]
+        layer2 = np.stack([np.sum(weights * values[j:j + remaining + 1], axis=0)
+                           for j in range(3)])
+        layer2 *= discount[lattice_idx] ** remaining
+        layer1 = up * layer2[:2] + down * layer2[1:]
+        return up * layer1[0] + down * layer1[1], layer1, layer2
+
+    # Valores y derivadas en un solo array (1 + derivadas, nodos, contratos):
+    # la parte up * V_up + down * V_down es común a todas las filas
+    stack = np.empty((1 + len(tangents),) + values.shape)
+    stack[0] = values
+    if tangents:
+        schedule = tangent_schedule(tangents, p, discount, lattice_idx, K, sign, price_adjust, steps,
+                                    american)
+        stack[1:] = schedule['start']
+        extra = np.empty_like(stack[1:])
+        # d se deduce de la capa terminal (S_N1 / S_N0 = d / u)
+        d = u * terminal_prices[1] / terminal_prices[0] if steps > 0 else u
+        exercised_next = np.zeros(values.shape, dtype=bool)
+
+    prices = terminal_prices.copy()
+    buffer = np.empty_like(stack)
+    # En las americanas el ejercicio de la capa i decide qué nodos ejercidos de
+    # la capa i + 1 leen las derivadas, así que los valores van primero
+    head = stack[:1] if american and tangents else stack
+    layers = {}
+    for i in range(steps - 1, -1, -1):
+        step_up, step_down = (up[i], down[i]) if per_step else (up, down)
+        if tangents:
+            # Término fuente de W (ver tangent_schedule), antes de pisar V_up
+            np.multiply(stack[0, :i + 1], schedule['source'][i], out=extra[:, :i + 1])
+        hold, work = head[:, :i + 1], buffer[:len(head), :i + 1]
+        np.multiply(head[:, 1:i + 2], step_down, out=work)
+        hold *= step_up
+        hold += work
+        if tangents and not american:
+            hold[1:] += extra[:, :i + 1]
+        if american:
+            # Precio del nodo (i, j) a partir del nodo (i + 1, j)
+            held, exercise = stack[0, :i + 1], buffer[0, :i + 1]
+            prices[:i + 1] /= u
+            np.subtract(node_prices(i, prices[:i + 1]), K, out=exercise)
+            exercise *= sign
+            if tangents:
+                # Los hijos ejercidos de un nodo de continuación (la frontera)
+                # toman la derivada del ejercicio; el resto no se lee
+                exercised = exercise > held
+                continued = ~exercised
+                for offset, move in ((0, u), (1, d)):
+                    nodes = np.flatnonzero(continued & exercised_next[offset:offset + i + 1])
+                    if nodes.size:
+                        rows, cols = np.divmod(nodes, exercised.shape[1])
+                        spot = prices[rows, lattice_idx[cols]] * move[lattice_idx[cols]]
+                        stack[1:, rows + offset, cols] = schedule['fill'](i + 1, rows + offset, cols, spot)
+                exercised_next = exercised
+                tangent, work = stack[1:, :i + 1], buffer[1:, :i + 1]
+                np.multiply(stack[1:, 1:i + 2], step_down, out=work)
+                tangent *= step_up
+                tangent += work
+                tangent += extra[:, :i + 1]
+            np.maximum(held, exercise, out=held)
+        if return_layers and i in (1, 2):
+            layers[i] = stack[0, :i + 1].copy()
+
+    result = (stack[0, 0], layers[1], layers[2]) if return_layers else (stack[0, 0],)
+    if tangents:
+        if american and steps > 0:
+            cols = np.flatnonzero(exercised_next[0])
+            stack[1:, 0, cols] = schedule['fill'](0, np.zeros_like(cols), cols, prices[0, lattice_idx[cols]])
+        derivatives = schedule['root'](stack[1:, 0], stack[0, 0])
+        result += (list(derivatives),)
+    return result if len(result) > 1 else result[0]
+
+def reverse_recurrence(multiplier, source):
+    """
+    Solución de x[N] = 0, x[i] = multiplier[i] * x[i + 1] + source[i] para
+    i = N - 1, ..., 0, con productos y sumas acumuladas (sin bucle por paso).
+    El primer eje es el paso; el resto se combina con broadcasting.
+    """
+    prefix = np.concatenate([np.ones_like(multiplier[:1]), np.cumprod(multiplier, axis=0)])
+    tail = np.cumsum((source * prefix[:-1])[::-1], axis=0)[::-1]
+    return np.concatenate([tail / prefix[:-1], np.zeros_like(source[:1])])
+
+def tangent_schedule(tangents, p, discount, lattice_idx, K, sign, price_adjust, steps, american):
+    """
+    Coeficientes por paso para propagar las derivadas de value_lattices.
+
+    La derivada T de cada nodo cumple, en la continuación,
+    T = up T_up + down T_down + a V_up + b V_down (a, b: derivadas de up y
+    down). En lugar de T se propaga W = T + c V, con
+    c_i = c_(i+1) - b_i / down_i, que elimina el término en V_down:
+
+        W = up W_up + down W_down + (a - b up / down) V_up
+
+    En los nodos ejercidos T = sign * dS y W = sign * dS + c E, con la
+    derivada del precio en forma cerrada: S_ij = spot u^(i-j) d^j escalado
+    por price_adjust, así que dS_ij / S_ij es lineal en j.
+
+    Devuelve 'start' y 'source', arrays (steps, derivadas, 1, contratos),
+    'fill' (solo americanas), el W de los nodos ejercidos (rows, cols) de la
+    capa i a partir de sus precios sin ajustar (spot), y 'root', que
+    recupera T en la raíz a partir de W y V.
+    """
+    lattices = p.shape[-1]
+
+    def by_step(x, rows):
+        """Array (rows, derivadas, 1, retículos) a partir de uno por retículo o por paso y retículo"""
+        return np.stack([np.broadcast_to(np.asarray(t), (rows, lattices)) for t in x],
+                        axis=1)[:, :, None, :]
+
+    up = np.broadcast_to(discount * p, (steps, lattices))[:, None, None, :]
+    down = np.broadcast_to(discount * (1 - p), (steps, lattices))[:, None, None, :]
+    a = by_step([t['up'] for t in tangents], steps)
+    b = by_step([t['down'] for t in tangents], steps)
+    source = (a - b * up / down)[..., lattice_idx]
+    c = reverse_recurrence(np.ones_like(down), -b / down)
+    c_contract = c[..., lattice_idx]
+    schedule = {
+        'start': np.stack([t['values'] for t in tangents]),
+        'source': source,
+        'fill': None,
+        'root': lambda w, value: w - c_contract[0, :, 0] * value,
+    }
+    if not american:
+        return schedule
+
+    # Precio real del nodo (i, j): S_ij * scale_i + shift_i, con S_ij = S_i0 (d / u)^j
+    if price_adjust is None:
+        scale, shift = np.ones((steps + 1, lattices)), np.zeros((steps + 1, lattices))
+    else:
+        scale, shift = price_adjust
+    zeros = np.zeros((steps + 1, lattices))
+    d_scale = by_step([zeros if t['price_adjust'] is None else t['price_adjust'][0] for t in tangents],
+                      steps + 1)
+    d_shift = by_step([zeros if t['price_adjust'] is None else t['price_adjust'][1] for t in tangents],
+                      steps + 1)
+    log_u = by_step([t['log_u'] for t in tangents], 1)
+    log_d = by_step([t['log_d'] for t in tangents], 1)
+    log_spot = by_step([t['log_spot'] for t in tangents], 1)
+    layer = np.arange(steps + 1)[:, None, None, None]
+    scale_step = scale[:, None, None, :]
+
+    # sign * (dS + c S_real) = sign * S (level_i + j slope_i) + offset_i
+    level = scale_step * (log_spot + layer * log_u + c) + d_scale
+    slope = scale_step * (log_d - log_u)
+    offset = sign * ((d_shift + c * shift[:, None, None, :])[..., lattice_idx] - c_contract * K)
+    sign = np.broadcast_to(sign, lattice_idx.shape)
+
+    def fill(i, rows, cols, spot):
+        lattice = lattice_idx[cols]
+        node = level[i, :, 0, lattice].T + rows * slope[i, :, 0, lattice].T
+        node *= sign[cols] * spot
+        return node + offset[i, :, 0, cols].T
+
+    schedule['fill'] = fill
+    return schedule
+
+def price_option(S0, K, r, u, d, p, delta_t, steps, option_type='call', american=False):
+    """Valúa una opción sin construir la matriz completa del árbol"""
+    terminal = create_price_tree(S0, u, d, steps, layout='terminal')
+    value = value_lattices(
+        terminal[:, None], np.array([0]), K, option_sign(option_type),
+        np.array([u]), np.array([p]), np.array([np.exp(-r * delta_t)]),
+        steps, american
+    )
+    return value[0]
+
+def lattice_tangent(plus, minus, width):
+    """
+    Derivadas de las entradas de value_lattices respecto de un parámetro,
+    por diferencias centrales entre dos juegos de entradas desplazados
+    (ver lattice_inputs en price_options_batch). Solo se desplazan arrays de
+    O(steps) por retículo; la derivada de cada nodo se arma en forma cerrada
+    a partir de las de log(spot), log(u) y log(d) (ver tangent_schedule) y
+    la inducción se hace una vez con value_lattices.
+    """
+    def diff(key):
+        return (plus[key] - minus[key]) / width
+
+    def log_diff(key):
+        return (np.log(plus[key]) - np.log(minus[key])) / width
+
+    price_adjust = None
+    if plus['price_adjust'] is not None:
+        price_adjust = tuple((x - y) / width for x, y in zip(plus['price_adjust'], minus['price_adjust']))
+    return {
+        'values': diff('payoff'),
+        'up': (plus['discount'] * plus['p'] - minus['discount'] * minus['p']) / width,
+        'down': (plus['discount'] * (1 - plus['p']) - minus['discount'] * (1 - minus['p'])) / width,
+        'log_spot': log_diff('spot'),
+        'log_u': log_diff('u'),
+        'log_d': log_diff('d'),
+        'price_adjust': price_adjust,
+    }
+
+def price_options_batch(S0, strikes, days_to_expiry, volatilities, option_types,
+                        r, steps, american=False, greeks=False, model='CRR',
+                        vol_bump=0.01, rate_bump=0.0001, dividend_yield=0.0,
+                        dividends=(), rate_curve=None):
+    """
+    Valúa una grilla de contratos en una sola pasada vectorizada.
+
+    Los argumentos por contrato (strikes, días al vencimiento, volatilidades y
+    tipos) se combinan con broadcasting de NumPy. Devuelve un DataFrame con una
+    fila por contrato.
+
+    Con greeks=True agrega delta, gamma y theta (leídas de las capas 1 y 2 del
+    retículo) y vega y rho. Para vega y rho solo se desplazan sigma y r en
+    los parámetros del retículo (u, d, p, descuentos y capa terminal); sus
+    derivadas se propagan sobre los mismos nodos en la misma inducción, sin
+    retículos extra; los pasos de esas diferencias son TANGENT_STEPS. Las
+    europeas con p constante, que no necesitan inducción, se revalúan en
+    O(steps) con sigma +/- vol_bump y r +/- rate_bump.
+
+    model elige la parametrización del retículo (ver LATTICE_MODELS):
+    - 'Tian' y 'Leisen-Reimer' cambian u, d y p; Leisen-Reimer usa un número
+      impar de pasos y un retículo por strike
+    - 'BBS' reemplaza el último paso por el precio Black-Scholes
+    - 'Richardson' extrapola dos árboles BBS: 2 * BBS(steps) - BBS(steps // 2);
+      con steps < 2 se valúa solo con BBS
+
+    dividend_yield es un dividendo continuo; dividends y rate_curve son los
+    calendarios de dividendos discretos y la curva de tasas cero descriptos en
+    market_schedule. Con ellos las probabilidades y descuentos pasan a ser
+    arrays por paso, calculados una vez antes de la inducción.
+    """
+    if model == 'Richardson' and steps < 2:
+        # El árbol grueso tendría steps // 2 = 0 pasos: sin extrapolación
+        model = 'BBS'
+    if model == 'Richardson':
+        args = (S0, strikes, days_to_expiry, volatilities, option_types, r)
+        options = dict(american=american, greeks=greeks, model='BBS',
+                       vol_bump=vol_bump, rate_bump=rate_bump,
+                       dividend_yield=dividend_yield, dividends=dividends,
+                       rate_curve=rate_curve)
+        fine = price_options_batch(*args, steps, **options)
+        coarse = price_options_batch(*args, steps // 2, **options)
+        columns = fine.columns[4:]
+        fine[columns] = 2 * fine[columns] - coarse[columns]
+        return fine
+
+    if model == 'Leisen-Reimer' and steps % 2 == 0:
+        steps += 1
+
+    strikes, days, vols, types = np.broadcast_arrays(
+        np.asarray(strikes, dtype=float), np.asarray(days_to_expiry, dtype=float),
+        np.asarray(volatilities, dtype=float), np.asarray(option_types)
+    )
+    strikes, days, vols, types = (a.ravel() for a in (strikes, days, vols, types))
+    sign = np.where(np.char.lower(types.astype(str)) == 'call', 1.0, -1.0)
+    rates = np.full(strikes.size, float(r))
+
+    # Un retículo por combinación distinta de (sigma, T, r), y por strike en LR
+    lattice_strike = strikes if model == 'Leisen-Reimer' else np.zeros_like(strikes)
+    keys, lattice_idx = np.unique(np.stack([vols, days, rates, lattice_strike]),
+                                  axis=1, return_inverse=True)
+    lattice_idx = lattice_idx.ravel()
+    lattice_vol, lattice_days, lattice_rate, lattice_K = keys
+    T = lattice_days / 365
+    delta_t = T / steps
+    q = dividend_yield
+    scheduled = rate_curve is not None or len(dividends) > 0
+    tree_steps = steps - 1 if model == 'BBS' else steps
+
+    def lattice_inputs(vol_shift=0.0, rate_shift=0.0):
+        """Entradas de value_lattices con sigma y r desplazados en todos los retículos"""
+        volatility = lattice_vol + vol_shift
+        rate = lattice_rate + rate_shift
+        if scheduled:
+            curve = rate_curve if rate_curve is not None else [(0, r)]
+            schedules = [market_schedule(S0, t, steps, curve, dividends, rate_i - r)
+                         for t, rate_i in zip(T, rate)]
+            step_rates = np.column_stack([sch['rates'] for sch in schedules])
+            zero_rate = np.array([sch['zero_rate'] for sch in schedules])
+            spot = np.array([sch['spot'] for sch in schedules])
+            scale = np.column_stack([sch['scale'] for sch in schedules])
+            shift = np.column_stack([sch['shift'] for sch in schedules])
+        else:
+            step_rates = zero_rate = rate
+            spot = np.full(rate.size, float(S0))
+            scale, shift = np.ones((steps + 1, 1)), np.zeros((steps + 1, 1))
+
+        u, d, p = lattice_parameters(model, spot, lattice_K, volatility, zero_rate - q, T, steps)
+        if scheduled:
+            p = (np.exp((step_rates - q) * delta_t) - d) / (u - d)
+        discount = np.exp(-step_rates * delta_t)
+        price_adjust = (scale, shift) if scheduled else None
+        terminal = spot * create_price_tree(1.0, u, d, tree_steps, layout='terminal')
+
+        if model == 'BBS':
+            # Último paso analítico: Black-Scholes con un delta_t restante
+            last_rate = step_rates[-1] if scheduled else rate
+            node_prices = terminal[:, lattice_idx]
+            if scheduled:
+                exercise_prices = node_prices * scale[-2, lattice_idx] + shift[-2, lattice_idx]
+                node_prices = node_prices * scale[-1, lattice_idx]
+            else:
+                exercise_prices = node_prices
+            terminal_values = black_scholes(node_prices, strikes, last_rate[lattice_idx],
+                                            volatility[lattice_idx], delta_t[lattice_idx],
+                                            sign, q)
+            if american:
+                terminal_values = np.maximum(terminal_values, sign * (exercise_prices - strikes))
+            if scheduled:
+                p, discount = p[:-1], discount[:-1]
+                price_adjust = (scale[:-1], shift[:-1])
+        else:
+            terminal_values = None
+
+        return {
+            'terminal': terminal, 'u': u, 'd': d, 'p': p, 'discount': discount,
+            'terminal_values': terminal_values, 'price_adjust': price_adjust,
+            'spot': spot, 'scale': scale, 'shift': shift,
+        }
+
+    def value(inputs, **options):
+        return value_lattices(
+            inputs['terminal'], lattice_idx, strikes, sign, inputs['u'], inputs['p'],
+            inputs['discount'], tree_steps, american, terminal_values=inputs['terminal_values'],
+            price_adjust=inputs['price_adjust'], **options
+        )
+
+    base = lattice_inputs()
+    table = pd.DataFrame({
+        'Strike': strikes,
+        'Días': days.astype(int),
+        'Volatilidad': vols,
+        'Tipo': types,
+    })
+    if not greeks:
+        table['Precio'] = value(base)
+        return table
+
+    # Sigma y r desplazados: solo cambian las entradas del retículo, O(steps) cada una
+    def bumped_inputs(vol_step, rate_step):
+        return [(lattice_inputs(vol_shift=vol_step), lattice_inputs(vol_shift=-vol_step), 2 * vol_step),
+                (lattice_inputs(rate_shift=rate_step), lattice_inputs(rate_shift=-rate_step), 2 * rate_step)]
+
+    if not american and np.ndim(base['p']) == 1:
+        prices, layer1, layer2 = value(base, return_layers=True)
+        derivatives = [(value(plus) - value(minus)) / width
+                       for plus, minus, width in bumped_inputs(vol_bump, rate_bump)]
+    else:
+        bumps = bumped_inputs(TANGENT_STEPS['vol'], TANGENT_STEPS['rate'])
+        for inputs in (base, *(x for bump in bumps for x in bump[:2])):
+            if inputs['terminal_values'] is None:
+                terminal = inputs['terminal'][:, lattice_idx]
+                if inputs['price_adjust'] is not None:
+                    terminal = terminal * inputs['scale'][-1, lattice_idx] + inputs['shift'][-1, lattice_idx]
+                inputs['payoff'] = np.maximum(sign * (terminal - strikes), 0)
+            else:
+                inputs['payoff'] = inputs['terminal_values']
+        tangents = [lattice_tangent(plus, minus, width) for plus, minus, width in bumps]
+        prices, layer1, layer2, derivatives = value(base, return_layers=True, tangents=tangents)
+
+    u, d, dt = base['u'][lattice_idx], base['d'][lattice_idx], delta_t[lattice_idx]
+    if scheduled:
+        start, scale, shift = base['spot'][lattice_idx], base['scale'][:, lattice_idx], base['shift'][:, lattice_idx]
+    else:
+        start, scale, shift = S0, base['scale'][:, [0] * strikes.size], base['shift'][:, [0] * strikes.size]
+    S1 = start * np.stack([u, d]) * scale[1] + shift[1]
+    S2 = start * np.stack([u * u, u * d, d * d]) * scale[2] + shift[2]
+    V1, V2 = layer1, layer2
+
+    table['Precio'] = prices
+    table['Delta'] = (V1[0] - V1[1]) / (S1[0] - S1[1])
+    table['Gamma'] = ((V2[0] - V2[1]) / (S2[0] - S2[1]) -
+                      (V2[1] - V2[2]) / (S2[1] - S2[2])) / ((S2[0] - S2[2]) / 2)
+    # Theta por día calendario, entre el nodo central de la capa 2 y la raíz.
+    # Si u * d != 1 (Tian, Leisen-Reimer) se corrige el desplazamiento de S.
+    shift = S2[1] - S0
+    centre = V2[1] - table['Delta'] * shift - 0.5 * table['Gamma'] * shift ** 2
+    table['Theta'] = (centre - prices) / (2 * dt) / 365
+    # Vega y rho por punto porcentual de volatilidad y de tasa
+    table['Vega'] = derivatives[0] / 100
+    table['Rho'] = derivatives[1] / 100
+    return table
+
+def convergence_table(S0, K, r, volatility, days_to_expiry, option_type, steps_list,
+                      models=LATTICE_MODELS):
+    """
+    Error y tiempo de cada modelo frente a Black-Scholes para una europea.
+
+    Devuelve el DataFrame de resultados y el precio de referencia.
+    """
+    sign = option_sign(option_type)
+    reference = black_scholes(S0, K, r, volatility, days_to_expiry / 365, sign)
+    rows = []
+    for model in models:
+        for steps in steps_list:
+            start = time.perf_counter()
+            price = price_options_batch(
+                S0, K, days_to_expiry, volatility, option_type, r, steps, model=model
+            )['Precio'].iloc[0]
+            elapsed = time.perf_counter() - start
+            rows.append({
+                'Modelo': model,
+                'Pasos': steps,
+                'Precio': price,
+                'Error': price - reference,
+                'Tiempo (ms)': elapsed * 1000,
+            })
+    return pd.DataFrame(rows), reference
+
+def create_option_tree(price_tree, K, r, p, delta_t, steps, option_type='call', american=False):
+    """Crea el árbol de valores de la opción (solo para visualización)"""
+    option_tree = np.zeros((steps + 1, steps + 1))
+    discount = np.exp(-r * delta_t)
+
+    # Valores finales
+    option_tree[:, steps] = payoff(price_tree[:, steps], K, option_type)
+
+    # Retroceder en el árbol, una columna por paso
+    for i in range(steps - 1, -1, -1):
+        hold_value = discount * (
+            p * option_tree[:i + 1, i + 1] +
+            (1 - p) * option_tree[1:i + 2, i + 1]
+        )
+        if american:
+            exercise_value = price_tree[:i + 1, i] - K
+            if option_type.lower() != 'call':
+                exercise_value = -exercise_value
+            hold_value = np.maximum(hold_value, exercise_value)
+        option_tree[:i + 1, i] = hold_value
+
+    return option_tree
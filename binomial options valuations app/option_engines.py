@@ -0,0 +1,166 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_banded
+
+from binomial_engine import option_sign, price_options_batch
+
+
+# Todos los motores comparten la firma
+# engine(S0, K, r, volatility, T, steps, option_type='call', american=False) -> precio
+
+def binomial_price(S0, K, r, volatility, T, steps, option_type='call', american=False):
+    """Árbol binomial CRR (motor vectorizado de binomial_engine)"""
+    return price_options_batch(
+        S0, K, T * 365, volatility, option_type, r, steps, american
+    )['Precio'].iloc[0]
+
+def trinomial_price(S0, K, r, volatility, T, steps, option_type='call', american=False):
+    """
+    Árbol trinomial (Boyle) con inducción hacia atrás sobre un buffer 1-D.
+
+    Como u * d = 1, cada capa es un tramo centrado de la capa terminal, así
+    que los valores de ejercicio se calculan una sola vez.
+    """
+    delta_t = T / steps
+    half = np.exp(volatility * np.sqrt(delta_t / 2))
+    growth = np.exp(r * delta_t / 2)
+    p_up = ((growth - 1 / half) / (half - 1 / half)) ** 2
+    p_down = ((half - growth) / (half - 1 / half)) ** 2
+    p_mid = 1 - p_up - p_down
+    discount = np.exp(-r * delta_t)
+
+    # Nodo m de la capa terminal: S0 * u**(steps - m), con u = half**2
+    sign = option_sign(option_type)
+    terminal = S0 * half ** (2 * (steps - np.arange(2 * steps + 1)))
+    exercise = sign * (terminal - K)
+    values = np.maximum(exercise, 0)
+
+    buffer = np.empty_like(values)
+    for i in range(steps - 1, -1, -1):
+        width = 2 * i + 1
+        hold, work = values[:width], buffer[:width]
+        np.multiply(values[1:width + 1], discount * p_mid, out=work)
+        work += (discount * p_down) * values[2:width + 2]
+        hold *= discount * p_up
+        hold += work
+        if american:
+            np.maximum(hold, exercise[steps - i:steps + i + 1], out=hold)
+    return values[0]
+
+# Penalización del ejercicio anticipado: escala de la penalización e iteraciones máximas por paso
+PENALTY = 1e8
+MAX_PENALTY_ITERATIONS = 20
+
+# Intervalos espaciales mínimos de Crank-Nicolson: con pocos pasos temporales
+# la grilla no puede quedar tan gruesa como sigma * sqrt(T)
+MIN_SPATIAL_STEPS = 200
+
+def spatial_steps(steps):
+    """Intervalos espaciales de Crank-Nicolson: una cantidad par (S0 en el nodo central)"""
+    spatial = max(steps, MIN_SPATIAL_STEPS)
+    return spatial + spatial % 2
+
+def _penalty_solve(bands, rhs, exercise, guess):
+    """
+    Resuelve el problema de complementariedad A V >= rhs, V >= exercise con
+    el método de penalización (Forsyth-Vetzal): en los nodos donde V queda
+    bajo el ejercicio se agrega PENALTY * (exercise - V) y se vuelve a
+    resolver hasta que ese conjunto no cambia. Cada iteración es un solve de
+    banda de LAPACK; suelen alcanzar una o dos por paso temporal.
+    """
+    active = guess < exercise
+    for _ in range(MAX_PENALTY_ITERATIONS):
+        penalized = bands.copy()
+        penalized[1] += PENALTY * active
+        values = solve_banded((1, 1), penalized, rhs + PENALTY * active * exercise)
+        updated = values < exercise
+        if np.array_equal(updated, active):
+            break
+        active = updated
+    return values
+
+def crank_nicolson_price(S0, K, r, volatility, T, steps, option_type='call', american=False,
+                         width=5.0):
+    """
+    Crank-Nicolson en log-precio con arranque de Rannacher.
+
+    Usa `steps` pasos temporales y spatial_steps(steps) intervalos espaciales
+    sobre ln(S0) +/- width * sigma * sqrt(T). Cada paso es un solve de banda de
+    LAPACK; el ejercicio anticipado se resuelve con penalización
+    (_penalty_solve), que repite ese solve mientras cambie el conjunto de
+    nodos ejercidos.
+    """
+    sign = option_sign(option_type)
+    spatial = spatial_steps(steps)
+    half_range = width * volatility * np.sqrt(T)
+    x = np.log(S0) + np.linspace(-half_range, half_range, spatial + 1)
+    prices = np.exp(x)
+    dx = x[1] - x[0]
+    delta_t = T / steps
+    exercise = sign * (prices - K)
+    values = np.maximum(exercise, 0)
+
+    # Operador L V = a V_{i-1} + b V_i + c V_{i+1} en los nodos interiores
+    drift = r - volatility ** 2 / 2
+    diffusion = volatility ** 2 / (2 * dx ** 2)
+    a = diffusion - drift / (2 * dx)
+    b = -2 * diffusion - r
+    c = diffusion + drift / (2 * dx)
+    interior = spatial - 1
+
+    for step in range(steps):
+        tau = (step + 1) * delta_t
+        # Rannacher: los dos primeros pasos son implícitos para suavizar el payoff
+        theta = 1.0 if step < 2 else 0.5
+        if american:
+            boundary = np.maximum(exercise[[0, -1]], 0)
+        else:
+            boundary = np.maximum(sign * (prices[[0, -1]] - K * np.exp(-r * tau)), 0)
+
+        inner = values[1:-1]
+        rhs = inner + (1 - theta) * delta_t * (
+            a * values[:-2] + b * inner + c * values[2:]
+        )
+        rhs[0] += theta * delta_t * a * boundary[0]
+        rhs[-1] += theta * delta_t * c * boundary[1]
+
+        # Matriz tridiagonal (I - theta dt L) en formato de banda de solve_banded
+        bands = np.empty((3, interior))
+        bands[0] = -theta * delta_t * c
+        bands[1] = 1 - theta * delta_t * b
+        bands[2] = -theta * delta_t * a
+        bands[0, 0] = bands[2, -1] = 0.0
+
+        if american:
+            solved = _penalty_solve(bands, rhs, exercise[1:-1], inner)
+        else:
+            solved = solve_banded((1, 1), bands, rhs)
+
+        values = np.concatenate(([boundary[0]], solved, [boundary[1]]))
+
+    return values[spatial // 2]
+
+# Motores disponibles: nombre -> (función, cantidad de nodos según steps)
+ENGINES = {
+    'Binomial (CRR)': (binomial_price, lambda steps: (steps + 1) * (steps + 2) // 2),
+    'Trinomial': (trinomial_price, lambda steps: (steps + 1) ** 2),
+    'Crank-Nicolson': (crank_nicolson_price, lambda steps: (steps + 1) * (spatial_steps(steps) + 1)),
+}
+
+def compare_engines(S0, K, r, volatility, T, steps, option_type='call', american=False,
+                    engines=ENGINES):
+    """Precio, tiempo de cálculo y cantidad de nodos de cada motor"""
+    rows = []
+    for name, (engine, node_count) in engines.items():
+        start = time.perf_counter()
+        price = engine(S0, K, r, volatility, T, steps, option_type, american)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            'Método': name,
+            'Precio': price,
+            'Tiempo (ms)': elapsed * 1000,
+            'Nodos': node_count(steps),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,32 @@
+import os
+
+import pandas as pd
+import yfinance as yf
+
+
+def yahoo_quote(ticker, source=None):
+    """Último precio desde Yahoo Finance usando fast_info (sin el pedido pesado de info)"""
+    return float(yf.Ticker(ticker).fast_info['lastPrice'])
+
+def read_snapshot(path):
+    """Lee un snapshot local de precios (CSV o Parquet) con columnas ticker y price"""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        snapshot = pd.read_parquet(path)
+    else:
+        snapshot = pd.read_csv(path)
+    snapshot.columns = snapshot.columns.str.lower()
+    return snapshot.set_index(snapshot['ticker'].str.upper())['price']
+
+def snapshot_quote(ticker, source):
+    """Precio de un ticker desde un snapshot local, sin acceso a la red"""
+    return float(read_snapshot(source)[ticker.upper()])
+
+# Proveedores disponibles: nombre -> función (ticker, source) -> precio
+QUOTE_PROVIDERS = {
+    'Yahoo Finance': yahoo_quote,
+    'Snapshot local': snapshot_quote,
+}
+
+def get_quote(ticker, provider='Yahoo Finance', source=None):
+    """Obtiene el precio de un ticker con el proveedor indicado"""
+    return QUOTE_PROVIDERS[provider](ticker, source)
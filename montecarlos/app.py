@@ -5,67 +5,93 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import datetime
+import os
+
+from monte_carlo_engine import (
+    MODEL_VARIANCE_REDUCTION, REBALANCE_POLICIES, RETURN_MODELS, VARIANCE_REDUCTION_METHODS, estimate_mean,
+    fit_return_model, gbm_final_price_mean, run_streaming
+)
+from risk_engine import confidence_intervals, historical_var_cvar
+
+# Percentiles del abanico: (P5, P25, P50, P75, P95)
+PERCENTILES = (5, 25, 50, 75, 95)
 
 def get_stock_data(symbol, start_date, end_date):
     stock = yf.download(symbol, start=start_date, end=end_date)
     return stock
 
-def calculate_transaction_costs(price, shares, commission=0.001, slippage=0.0001):
+def run_monte_carlo(data, n_simulations, n_days, initial_investment=10000, chunk_size=10000,
+                    seed=None, workers=1, method='none', rebalancing=None, model='normal'):
     """
-    Calcula los costos de transacción
-    commission: 0.1% por operación
-    slippage: 0.01% por operación
-    """
-    commission_cost = price * shares * commission
-    slippage_cost = price * shares * slippage
-    return commission_cost + slippage_cost
+    Simula por bloques de chunk_size trayectorias y devuelve un StreamingResult
+    con percentiles por día, valores finales y una muestra de trayectorias.
+    Los bloques se reparten entre `workers` procesos; con la misma semilla el
+    resultado no depende de la cantidad de procesos.
 
-def run_monte_carlo(data, n_simulations, n_days, initial_investment=10000):
-    # Calcular retornos diarios considerando costos
-    returns = np.log(1 + data['Adj Close'].pct_change())
-    mu = returns.mean()
-    sigma = returns.std()
-    
-    # Parámetros de costos
-    commission_rate = 0.001  # 0.1%
-    slippage_rate = 0.0001  # 0.01%
-    transaction_frequency = 5  # Días promedio entre operaciones
-    
-    simulations = np.zeros((n_days, n_simulations))
-    equity_curves = np.zeros((n_days, n_simulations))
-    drawdowns = np.zeros((n_days, n_simulations))
+    `model` es el modelo de retornos ajustado a la historia (ver
+    RETURN_MODELS), `method` la reducción de varianza (ver
+    VARIANCE_REDUCTION_METHODS) y `rebalancing` la política de rebalanceo y
+    los costos (parámetros de rebalance_equity). También devuelve la media
+    estimada del valor final, su error estándar y los parámetros ajustados.
+    """
+    # Calcular retornos diarios
+    returns = np.log(1 + data['Adj Close'].pct_change()).dropna()
     
     initial_price = data['Adj Close'].iloc[-1]
     
-    for i in range(n_simulations):
-        # Generar retornos aleatorios
-        daily_returns = np.random.normal(mu, sigma, n_days)
-        
-        # Calcular precios
-        price_path = initial_price * np.exp(np.cumsum(daily_returns))
-        
-        # Calcular equity curve con costos
-        equity = np.zeros(n_days)
-        equity[0] = initial_investment
-        
-        for day in range(1, n_days):
-            # Aplicar retorno del día
-            equity[day] = equity[day-1] * (1 + daily_returns[day])
-            
-            # Aplicar costos de transacción si corresponde
-            if day % transaction_frequency == 0:
-                transaction_cost = equity[day] * (commission_rate + slippage_rate)
-                equity[day] -= transaction_cost
-        
-        simulations[:, i] = price_path
-        equity_curves[:, i] = equity
-        
-        # Calcular drawdown
-        peak = np.maximum.accumulate(equity)
-        drawdown = (equity - peak) / peak
-        drawdowns[:, i] = drawdown
-        
-    return simulations, equity_curves, drawdowns
+    # Cada bloque de retornos aleatorios es una matriz (días x simulaciones)
+    draw_returns, params = fit_return_model(returns, n_days, model, method)
+    
+    result = run_streaming(
+        draw_returns, n_simulations, initial_price, initial_investment, rebalancing, chunk_size,
+        seed=seed, workers=workers
+    )
+    # Variable de control: precio final, con esperanza analítica bajo GBM
+    control_mean = None
+    if method == 'control_variate':
+        control_mean = gbm_final_price_mean(initial_price, n_days, params['mu'], params['sigma'])
+    return result, estimate_mean(result, method, control_mean), params
+
+def nan_joined(x, paths):
+    """
+    Une las columnas de `paths` (días x trayectorias) en una sola serie
+    separada por NaN, para dibujarlas todas con una única traza
+    """
+    n_days, n_paths = paths.shape
+    xs = np.tile(np.append(np.asarray(x, dtype=object), None), n_paths)
+    ys = np.vstack([paths, np.full((1, n_paths), np.nan)]).T.ravel()
+    return xs, ys
+
+def add_fan_chart(fig, x, bands, rgb, name, row=None, col=None):
+    """
+    Abanico de percentiles: bandas 5-95 y 25-75 rellenas y la mediana.
+    `bands` son los percentiles (5, 25, 50, 75, 95) por día, (5, días);
+    `rgb` es el color como 'r, g, b'.
+    """
+    for (lower, upper), alpha in (((0, 4), 0.15), ((1, 3), 0.3)):
+        fig.add_trace(go.Scatter(
+            x=x, y=bands[lower], mode='lines', line=dict(width=0),
+            hoverinfo='skip', showlegend=False
+        ), row=row, col=col)
+        fig.add_trace(go.Scatter(
+            x=x, y=bands[upper], mode='lines', line=dict(width=0),
+            fill='tonexty', fillcolor=f"rgba({rgb}, {alpha})",
+            name=f"{name} P{PERCENTILES[lower]}-P{PERCENTILES[upper]}"
+        ), row=row, col=col)
+    fig.add_trace(go.Scatter(
+        x=x, y=bands[2], mode='lines', line=dict(color=f"rgb({rgb})", width=2),
+        name=f"{name} Mediana"
+    ), row=row, col=col)
+
+def add_sample_paths(fig, x, paths, rgb, name, row=None, col=None):
+    """Trayectorias de muestra como una sola traza WebGL separada por NaN"""
+    if paths.shape[1] == 0:
+        return
+    xs, ys = nan_joined(x, paths)
+    fig.add_trace(go.Scattergl(
+        x=xs, y=ys, mode='lines', line=dict(color=f"rgba({rgb}, 0.3)", width=0.5),
+        name=f"{name} (muestra)"
+    ), row=row, col=col)
 
 def main():
     st.title("Dashboard de Análisis de Mercado con Simulación Monte Carlo")
@@ -73,9 +99,38 @@ def main():
     # Inputs en la barra lateral
     st.sidebar.header("Parámetros")
     symbol = st.sidebar.text_input("Símbolo de la Acción", value="AAPL")
-    n_simulations = st.sidebar.number_input("Número de Simulaciones", min_value=100, max_value=10000, value=5000)
+    n_simulations = st.sidebar.number_input("Número de Simulaciones", min_value=100, max_value=1000000, value=5000)
     n_days = st.sidebar.number_input("Días de Pronóstico", min_value=30, max_value=365, value=252)
     initial_investment = st.sidebar.number_input("Inversión Inicial ($)", min_value=1000, value=10000)
+    chunk_size = st.sidebar.number_input("Trayectorias por Bloque", min_value=1000, max_value=100000, value=10000,
+                                         help="Limita la memoria: solo se guarda un bloque a la vez")
+    seed = st.sidebar.number_input("Semilla", min_value=0, value=42)
+    workers = st.sidebar.number_input("Procesos en Paralelo", min_value=1, max_value=os.cpu_count() or 1,
+                                      value=os.cpu_count() or 1)
+    n_sample_paths = st.sidebar.number_input("Trayectorias de Muestra en Gráficos", min_value=0, max_value=100,
+                                             value=20)
+    return_model = RETURN_MODELS[st.sidebar.selectbox("Modelo de Retornos", list(RETURN_MODELS))]
+    variance_reduction = st.sidebar.selectbox(
+        "Reducción de Varianza",
+        [label for label, method in VARIANCE_REDUCTION_METHODS.items()
+         if method in MODEL_VARIANCE_REDUCTION[return_model]]
+    )
+    
+    # Rebalanceo y costos
+    st.sidebar.header("Rebalanceo y Costos")
+    rebalance_policy = REBALANCE_POLICIES[st.sidebar.selectbox("Política de Rebalanceo", list(REBALANCE_POLICIES))]
+    target_weight = st.sidebar.slider("Peso Objetivo en la Acción (%)", 0, 100, 100,
+                                      help="El resto queda en efectivo") / 100
+    rebalancing = {'policy': rebalance_policy, 'target_weight': target_weight}
+    if rebalance_policy == 'calendar':
+        rebalancing['frequency'] = st.sidebar.number_input("Días entre Rebalanceos", min_value=1,
+                                                           max_value=252, value=5)
+    elif rebalance_policy == 'threshold':
+        rebalancing['band'] = st.sidebar.slider("Banda de Tolerancia (%)", 0.5, 25.0, 5.0) / 100
+    rebalancing['commission'] = st.sidebar.number_input("Comisión (%)", min_value=0.0, max_value=5.0,
+                                                        value=0.1, step=0.01) / 100
+    rebalancing['slippage'] = st.sidebar.number_input("Slippage (%)", min_value=0.0, max_value=5.0,
+                                                      value=0.01, step=0.01) / 100
     
     # Fechas
     end_date = datetime.datetime.now()
@@ -90,9 +145,22 @@ def main():
             
         # Ejecutar simulación
         with st.spinner("Ejecutando simulaciones Monte Carlo..."):
-            simulations, equity_curves, drawdowns = run_monte_carlo(
-                data, n_simulations, n_days, initial_investment)
+            result, (mean_value, mean_error), model_params = run_monte_carlo(
+                data, n_simulations, n_days, initial_investment, chunk_size,
+                seed=int(seed), workers=int(workers),
+                method=VARIANCE_REDUCTION_METHODS[variance_reduction], rebalancing=rebalancing,
+                model=return_model)
+            simulations = result.samples['price']
+            equity_curves = result.samples['equity']
+            drawdowns = result.samples['drawdown']
+            final_values, max_drawdowns = result.finals()
+            trading = result.trading_totals()
             
+        # Eje de fechas de la simulación, construido una sola vez (como texto
+        # corto: es lo que más pesa en el JSON de las trazas de muestra)
+        dates = pd.date_range(start=data.index[-1], periods=n_days, freq='B').strftime('%Y-%m-%d')
+        n_samples = min(int(n_sample_paths), simulations.shape[1])
+        
         # 1. Gráfico de Simulaciones Monte Carlo
         fig1 = go.Figure()
         
@@ -104,53 +172,39 @@ def main():
             line=dict(color='blue', width=2)
         ))
         
-        # Simulaciones
-        for i in range(min(100, n_simulations)):
-            fig1.add_trace(go.Scatter(
-                x=pd.date_range(start=data.index[-1], periods=n_days, freq='B'),
-                y=simulations[:, i],
-                name=f"Sim {i}",
-                line=dict(color='gray', width=0.5),
-                opacity=0.1,
-                showlegend=False
-            ))
+        # Simulaciones: abanico de percentiles y una muestra de trayectorias
+        add_fan_chart(fig1, dates, result.bands('price', PERCENTILES), '128, 128, 128', "Precio")
+        add_sample_paths(fig1, dates, simulations[:, :n_samples], '128, 128, 128', "Precio")
             
         fig1.update_layout(title="Simulaciones Monte Carlo")
         st.plotly_chart(fig1)
         st.markdown("""
         **Explicación:** Este gráfico muestra las posibles trayectorias futuras del precio del activo. 
-        La línea azul representa el precio histórico, mientras que las líneas grises son las diferentes 
-        simulaciones basadas en la volatilidad histórica y el retorno esperado.
+        La línea azul representa el precio histórico; las bandas grises contienen el 50% y el 90% central 
+        de las simulaciones de cada día, basadas en la volatilidad histórica y el retorno esperado, y la 
+        línea gris es la mediana.
         """)
         
         # 2. Curva de Equity y Drawdown
         fig2 = make_subplots(rows=2, cols=1)
         
         # Equity Curve
-        for i in range(min(100, n_simulations)):
-            fig2.add_trace(
-                go.Scatter(
-                    y=equity_curves[:, i],
-                    name=f"Equity {i}",
-                    line=dict(color='gray', width=0.5),
-                    opacity=0.1,
-                    showlegend=False
-                ),
-                row=1, col=1
-            )
+        add_fan_chart(fig2, dates, result.bands('equity', PERCENTILES), '128, 128, 128', "Equity",
+                      row=1, col=1)
+        add_sample_paths(fig2, dates, equity_curves[:, :n_samples], '128, 128, 128', "Equity",
+                         row=1, col=1)
+        moments = result.equity_moments
+        fig2.add_trace(go.Scatter(
+            x=dates, y=moments.mean, mode='lines', line=dict(color='black', width=1, dash='dash'),
+            customdata=moments.std, name="Equity Media",
+            hovertemplate="Media: %{y:,.2f}<br>Desvío: %{customdata:,.2f}<extra></extra>"
+        ), row=1, col=1)
             
         # Drawdown
-        for i in range(min(100, n_simulations)):
-            fig2.add_trace(
-                go.Scatter(
-                    y=drawdowns[:, i] * 100,
-                    name=f"Drawdown {i}",
-                    line=dict(color='red', width=0.5),
-                    opacity=0.1,
-                    showlegend=False
-                ),
-                row=2, col=1
-            )
+        add_fan_chart(fig2, dates, result.bands('drawdown', PERCENTILES) * 100, '255, 0, 0', "Drawdown",
+                      row=2, col=1)
+        add_sample_paths(fig2, dates, drawdowns[:, :n_samples] * 100, '255, 0, 0', "Drawdown",
+                         row=2, col=1)
             
         fig2.update_layout(
             height=800,
@@ -162,18 +216,21 @@ def main():
         st.plotly_chart(fig2)
         st.markdown("""
         **Explicación:** 
-        - La gráfica superior muestra la evolución del capital (equity) para cada simulación.
-        - La gráfica inferior muestra el drawdown (caída desde máximos) en porcentaje para cada simulación.
+        - La gráfica superior muestra las bandas de percentiles de la evolución del capital (equity)
+          y, en línea punteada, su media por día (el desvío estándar aparece al pasar el cursor).
+        - La gráfica inferior muestra las bandas del drawdown (caída desde máximos) en porcentaje.
         """)
         
         # 3. Distribución de Retornos Finales
-        final_values = equity_curves[-1, :]
         final_returns = (final_values - initial_investment) / initial_investment * 100
         
+        # Se agrupa en el servidor: al navegador solo llegan los 50 conteos
+        counts, edges = np.histogram(final_returns, bins=50)
         fig3 = go.Figure()
-        fig3.add_trace(go.Histogram(
-            x=final_returns,
-            nbinsx=50,
+        fig3.add_trace(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=np.diff(edges),
             name="Distribución de Retornos"
         ))
         
@@ -195,25 +252,36 @@ def main():
         """)
         
         # Estadísticas
-        max_drawdowns = np.min(drawdowns, axis=0) * 100
+        max_drawdowns = max_drawdowns * 100
+        var_95, cvar_95 = (values[0] for values in historical_var_cvar(final_returns, 0.95))
         stats = pd.DataFrame({
             'Métrica': [
                 'Inversión Inicial',
                 'Retorno Medio (%)',
+                'Error Estándar del Retorno Medio (%)',
                 'Retorno Mediano (%)',
                 'Drawdown Máximo Medio (%)',
                 'Drawdown Máximo Mediano (%)',
                 'VaR 95% (%)',
-                'Pérdida Máxima Potencial (%)'
+                'CVaR 95% (%)',
+                'Pérdida Máxima Potencial (%)',
+                'Costos de Transacción Medios ($)',
+                'Nominal Operado Medio ($)',
+                'Rebalanceos Medios'
             ],
             'Valor': [
                 f"${initial_investment:,.2f}",
-                f"{np.mean(final_returns):.2f}%",
+                f"{(mean_value / initial_investment - 1) * 100:.2f}%",
+                f"{mean_error / initial_investment * 100:.3f}%" if np.isfinite(mean_error) else "n/d",
                 f"{np.median(final_returns):.2f}%",
                 f"{np.mean(max_drawdowns):.2f}%",
                 f"{np.median(max_drawdowns):.2f}%",
-                f"{np.percentile(final_returns, 5):.2f}%",
-                f"{np.min(final_returns):.2f}%"
+                f"{var_95:.2f}%",
+                f"{cvar_95:.2f}%",
+                f"{np.min(final_returns):.2f}%",
+                f"${trading['costs'].mean():,.2f}",
+                f"${trading['traded'].mean():,.2f}",
+                f"{trading['rebalances'].mean():.1f}"
             ]
         })
         
@@ -222,17 +290,36 @@ def main():
         **Explicación de las métricas:**
         - **Inversión Inicial:** Capital inicial invertido
         - **Retorno Medio/Mediano:** Rendimiento promedio/mediano al final del período
+        - **Error Estándar del Retorno Medio:** Precisión de la estimación Monte Carlo del retorno medio
+          según el método de reducción de varianza elegido
         - **Drawdown Máximo Medio/Mediano:** Caída promedio/mediana máxima desde picos
         - **VaR 95%:** Pérdida máxima esperada con 95% de confianza
+        - **CVaR 95%:** Retorno promedio del 5% de peores escenarios
         - **Pérdida Máxima Potencial:** Peor escenario simulado
+        - **Costos de Transacción / Nominal Operado:** Comisión más slippage pagados sobre el nominal 
+          efectivamente operado (compra inicial y rebalanceos), promedio por trayectoria
+        - **Rebalanceos Medios:** Cantidad de rebalanceos por trayectoria según la política elegida
+        """)
+        
+        # Parámetros del modelo de retornos
+        st.write("Parámetros Ajustados del Modelo de Retornos")
+        st.table(pd.DataFrame({
+            'Parámetro': list(model_params),
+            'Valor': [f"{value:.6g}" for value in model_params.values()]
+        }))
+        st.markdown("""
+        **Explicación:** Parámetros ajustados a los retornos logarítmicos diarios históricos. 
+        Student-t y GARCH(1,1) reproducen colas pesadas y agrupamiento de volatilidad; el bootstrap 
+        por bloques remuestrea tramos contiguos de la propia historia.
         """)
         
         # Intervalos de Confianza
         confidence_levels = [50, 60, 70, 80, 90, 95, 97, 98, 99]
+        lower_returns, upper_returns = confidence_intervals(final_returns, confidence_levels)
         conf_intervals = pd.DataFrame({
             'Nivel de Confianza (%)': confidence_levels,
-            'Retorno Mínimo (%)': [np.percentile(final_returns, (100-x)/2) for x in confidence_levels],
-            'Retorno Máximo (%)': [np.percentile(final_returns, 100-(100-x)/2) for x in confidence_levels]
+            'Retorno Mínimo (%)': lower_returns,
+            'Retorno Máximo (%)': upper_returns
         })
         
         st.write("Intervalos de Confianza para Retornos")
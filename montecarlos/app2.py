@@ -1,43 +1,65 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
 import plotly.express as px
+import os
+import time
 from datetime import datetime, timedelta
 from scipy.stats import norm
 
+from price_providers import PRICE_PROVIDERS, get_prices, save_fixture
+from portfolio_engine import (
+    annualized_moments, efficient_frontier, portfolio_metrics, portfolio_turnover, random_weights,
+    simulate_returns
+)
+from backtest_engine import walk_forward_backtest
+from risk_engine import historical_var_cvar, monte_carlo_var_cvar, parametric_var_cvar
+
 # Configuración de la página
 st.set_page_config(page_title="Portfolio Optimizer", layout="wide")
 
+# Caché en disco por ticker y rango de fechas, junto a la app
+PRICE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.price_cache')
+
+# Con shrinkage o factores la covarianza sigue siendo estable en universos grandes
+MAX_STOCKS = 510
+
+# Niveles de confianza y escenarios de la tabla de riesgo
+RISK_LEVELS = [0.90, 0.95, 0.99]
+RISK_SIMULATIONS = 10000
+
+# Backtest: frecuencia de rebalanceo en días hábiles y objetivo del optimizador
+REBALANCE_FREQUENCIES = {'Daily': 1, 'Weekly': 5, 'Monthly': 21, 'Quarterly': 63}
+BACKTEST_OBJECTIVES = {'Max Sharpe': 'max_sharpe', 'Min Variance': 'min_variance'}
+
+# Estimadores de covarianza: etiqueta -> método de annualized_moments
+COVARIANCE_MODELS = {
+    'Sample': 'sample',
+    'Ledoit-Wolf shrinkage': 'ledoit_wolf',
+    'PCA factor model': 'pca',
+}
+
 # Funciones de utilidad
-def calculate_metrics(returns, weights, rf_rate):
-    port_ret = np.sum(returns.mean() * weights) * 252
-    port_vol = np.sqrt(np.dot(weights.T, np.dot(returns.cov() * 252, weights)))
-    sharpe = (port_ret - rf_rate) / port_vol
-    
-    # Calcular VaR y CVaR
-    port_returns = returns.dot(weights)
-    var_95 = np.percentile(port_returns, 5)
-    cvar_95 = port_returns[port_returns <= var_95].mean()
-    
-    # Maximum Drawdown
-    cum_returns = (1 + port_returns).cumprod()
-    rolling_max = cum_returns.expanding().max()
-    drawdowns = cum_returns/rolling_max - 1
-    max_drawdown = drawdowns.min()
-    
-    return port_ret, port_vol, sharpe, var_95, cvar_95, max_drawdown
+@st.cache_data(show_spinner=False)
+def get_stock_data(tickers, start_date, end_date, provider='Yahoo Finance', source=None, source_mtime=None):
+    """
+    Precios de todos los tickers en un único pedido, alineados por fecha.
 
-def get_stock_data(tickers, start_date, end_date):
-    data = pd.DataFrame()
-    for ticker in tickers:
-        try:
-            stock_data = yf.download(ticker, start=start_date, end=end_date)['Adj Close']
-            data[ticker] = stock_data
-        except:
-            st.error(f"Error downloading data for {ticker}")
-    return data
+    Las descargas de Yahoo se guardan en disco por ticker, así que repetir
+    las mismas fechas no vuelve a la red. Un fixture local ya está en disco:
+    source_mtime solo forma parte de la clave de caché, para releerlo cuando
+    cambia el archivo.
+    """
+    cache_dir = PRICE_CACHE_DIR if provider == 'Yahoo Finance' else None
+    return get_prices(tickers, start_date, end_date, provider, source, cache_dir)
+
+@st.cache_data
+def load_sp500_tickers():
+    """Constituyentes del S&P 500 desde Wikipedia, con el formato de símbolos de Yahoo"""
+    url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+    table = pd.read_html(url, header=0)[0]
+    return table['Symbol'].str.replace('.', '-', regex=False).tolist()
 
 # Título y descripción
 st.title("📊 Advanced Portfolio Optimizer")
@@ -52,13 +74,28 @@ with st.sidebar:
     
     # Input para tickers
     default_tickers = "AAPL,MSFT,GOOGL,AMZN,JPM"
-    tickers_input = st.text_input("Enter stock tickers (comma-separated, max 15):", 
-                                 value=default_tickers)
-    stocks = [x.strip() for x in tickers_input.split(',')]
+    use_sp500 = st.checkbox("Use all S&P 500 constituents")
+    if use_sp500:
+        stocks = load_sp500_tickers()
+    else:
+        tickers_input = st.text_input(f"Enter stock tickers (comma-separated, max {MAX_STOCKS}):", 
+                                     value=default_tickers)
+        stocks = [x.strip() for x in tickers_input.split(',')]
+    
+    if len(stocks) > MAX_STOCKS:
+        st.error(f"Maximum {MAX_STOCKS} stocks allowed")
+        stocks = stocks[:MAX_STOCKS]
     
-    if len(stocks) > 15:
-        st.error("Maximum 15 stocks allowed")
-        stocks = stocks[:15]
+    # Fuente de precios
+    provider = st.selectbox("Price Provider", list(PRICE_PROVIDERS))
+    source, source_mtime, fixture_path = None, None, ""
+    if provider == 'Fixture local':
+        source = st.text_input("Fixture path (CSV/Parquet, dates x tickers)", value="prices_fixture.csv")
+        if os.path.exists(source):
+            source_mtime = os.path.getmtime(source)
+    else:
+        fixture_path = st.text_input("Save prices as fixture (optional CSV/Parquet path)", value="",
+                                     help="Replay the download offline later with the 'Fixture local' provider")
     
     # Fechas
     col1, col2 = st.columns(2)
@@ -91,39 +128,95 @@ with st.sidebar:
     
     num_simulations = st.slider("Number of Simulations", 
                               min_value=100, 
-                              max_value=5000, 
+                              max_value=100000, 
                               value=1000)
+    
+    # Restricciones del optimizador exacto (long-only)
+    st.header("Optimizer Constraints")
+    covariance_model = st.selectbox("Covariance Model", list(COVARIANCE_MODELS),
+                                    help="Shrinkage and factor models keep the covariance well "
+                                         "conditioned when there are many stocks")
+    cov_method = COVARIANCE_MODELS[covariance_model]
+    n_factors = 5
+    if cov_method == 'pca':
+        n_factors = st.slider("Number of Factors", 
+                             min_value=1, 
+                             max_value=20, 
+                             value=5)
+    min_weight = st.slider("Min Weight per Stock (%)", 
+                          min_value=0.0, 
+                          max_value=20.0, 
+                          value=0.0) / 100
+    max_weight = st.slider("Max Weight per Stock (%)", 
+                          min_value=5.0, 
+                          max_value=100.0, 
+                          value=100.0) / 100
+    frontier_points = st.slider("Efficient Frontier Points", 
+                               min_value=10, 
+                               max_value=200, 
+                               value=50)
+    rebalance_penalty = st.checkbox("Penalize turnover from an equal-weight portfolio",
+                                    help="Subtracts (transaction cost + slippage) x turnover "
+                                         "from the expected return of every portfolio, sampled or optimized")
+    
+    # Backtest walk-forward
+    st.header("Walk-Forward Backtest")
+    backtest_window = st.slider("Estimation Window (days)", 
+                               min_value=60, 
+                               max_value=504, 
+                               value=252)
+    rebalance_label = st.selectbox("Rebalancing Frequency", list(REBALANCE_FREQUENCIES), index=2)
+    backtest_objective = st.selectbox("Backtest Objective", list(BACKTEST_OBJECTIVES))
 
 # Main content
 if st.button("Run Optimization"):
     with st.spinner("Downloading stock data and running simulations..."):
         # Obtener datos
-        stock_data = get_stock_data(stocks, start_date, end_date)
+        stock_data, missing = get_stock_data(stocks, start_date, end_date, provider, source, source_mtime)
+        for ticker in missing:
+            st.error(f"Error downloading data for {ticker}")
+        if fixture_path and not stock_data.empty:
+            save_fixture(stock_data, fixture_path)
+            st.caption(f"Prices saved as a fixture to {fixture_path}")
         returns = stock_data.pct_change().dropna()
         
         if returns.empty:
             st.error("No data available for the selected stocks and date range")
         else:
-            # Arrays para almacenar resultados
-            all_weights = np.zeros((num_simulations, len(stocks)))
-            metrics = np.zeros((num_simulations, 6))  # Ret, Vol, Sharpe, VaR, CVaR, MaxDD
+            n_assets = returns.shape[1]
             
-            # Simulación Monte Carlo
-            for port in range(num_simulations):
-                weights = np.random.random(len(stocks))
-                weights = weights/np.sum(weights)
-                all_weights[port,:] = weights
-                
-                metrics[port,:] = calculate_metrics(returns, weights, rf_rate)
+            # Simulación Monte Carlo: todos los pesos en una matriz (portafolios x activos)
+            start = time.perf_counter()
+            all_weights = random_weights(num_simulations, n_assets)
+            
+            # Ret, Vol, Sharpe, VaR, CVaR, MaxDD de todos los portafolios a la vez
+            results = portfolio_metrics(returns, all_weights, rf_rate, cov_method=cov_method,
+                                        n_factors=n_factors)
+            current_weights = np.full(n_assets, 1 / n_assets) if rebalance_penalty else None
+            if rebalance_penalty:
+                # Mismo costo que el QP: retorno neto de (costo + slippage) x turnover
+                turnover = portfolio_turnover(all_weights, current_weights)
+                results['Return'] -= (transaction_cost + slippage) * turnover
+                results['Sharpe'] = (results['Return'] - rf_rate) / results['Volatility']
+            random_idx = results['Sharpe'].argmax()
+            random_time = time.perf_counter() - start
             
-            # Crear DataFrame con resultados
-            results = pd.DataFrame(metrics, 
-                                 columns=['Return', 'Volatility', 'Sharpe', 
-                                        'VaR_95', 'CVaR_95', 'Max_Drawdown'])
+            # Frontera eficiente exacta (programación cuadrática)
+            start = time.perf_counter()
+            mean, cov = annualized_moments(returns, cov_method, n_factors)
+            try:
+                frontier, _, min_variance, max_sharpe = efficient_frontier(
+                    mean, cov, rf_rate, frontier_points, (min_weight, max_weight),
+                    current_weights, transaction_cost + slippage)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            qp_time = time.perf_counter() - start
             
-            # Encontrar portafolio óptimo
-            optimal_idx = results['Sharpe'].argmax()
-            optimal_weights = all_weights[optimal_idx,:]
+            # Portafolio óptimo: Sharpe máximo exacto
+            optimal_weights = max_sharpe['weights']
+            optimal = portfolio_metrics(returns, optimal_weights, rf_rate, cov_method=cov_method,
+                                        n_factors=n_factors).iloc[0]
             
             # Display results in multiple columns
             col1, col2, col3 = st.columns(3)
@@ -133,19 +226,19 @@ if st.button("Run Optimization"):
                 metrics_df = pd.DataFrame({
                     'Metric': ['Expected Return', 'Volatility', 'Sharpe Ratio',
                              'VaR (95%)', 'CVaR (95%)', 'Max Drawdown'],
-                    'Value': [f"{results.iloc[optimal_idx]['Return']*100:.2f}%",
-                             f"{results.iloc[optimal_idx]['Volatility']*100:.2f}%",
-                             f"{results.iloc[optimal_idx]['Sharpe']:.2f}",
-                             f"{results.iloc[optimal_idx]['VaR_95']*100:.2f}%",
-                             f"{results.iloc[optimal_idx]['CVaR_95']*100:.2f}%",
-                             f"{results.iloc[optimal_idx]['Max_Drawdown']*100:.2f}%"]
+                    'Value': [f"{optimal['Return']*100:.2f}%",
+                             f"{optimal['Volatility']*100:.2f}%",
+                             f"{optimal['Sharpe']:.2f}",
+                             f"{optimal['VaR_95']*100:.2f}%",
+                             f"{optimal['CVaR_95']*100:.2f}%",
+                             f"{optimal['Max_Drawdown']*100:.2f}%"]
                 })
                 st.dataframe(metrics_df)
             
             with col2:
                 st.subheader("Optimal Weights")
                 weights_df = pd.DataFrame({
-                    'Stock': stocks,
+                    'Stock': returns.columns,
                     'Weight': [f"{w*100:.2f}%" for w in optimal_weights]
                 })
                 st.dataframe(weights_df)
@@ -156,12 +249,45 @@ if st.button("Run Optimization"):
                 st.write(f"Transaction Cost: ${total_cost:,.2f}")
                 st.write(f"Effective Investment: ${initial_capital-total_cost:,.2f}")
             
+            # Comparación de métodos
+            st.subheader("Optimization Methods")
+            return_label = "Net Return" if rebalance_penalty else "Return"
+            methods_df = pd.DataFrame({
+                'Method': [f"Random sampling ({num_simulations:,} portfolios)",
+                           f"QP frontier ({frontier_points} points) - max Sharpe",
+                           f"QP frontier ({frontier_points} points) - min variance"],
+                return_label: [f"{r*100:.2f}%" for r in (results.iloc[random_idx]['Return'],
+                                                         max_sharpe['Return'], min_variance['Return'])],
+                'Volatility': [f"{v*100:.2f}%" for v in (results.iloc[random_idx]['Volatility'],
+                                                          max_sharpe['Volatility'], min_variance['Volatility'])],
+                'Sharpe Ratio': [f"{s:.3f}" for s in (results.iloc[random_idx]['Sharpe'],
+                                                      max_sharpe['Sharpe'], min_variance['Sharpe'])],
+                'Time (ms)': [f"{random_time*1000:.1f}", f"{qp_time*1000:.1f}", f"{qp_time*1000:.1f}"]
+            })
+            st.dataframe(methods_df)
+            
+            # VaR/CVaR diarios del portafolio óptimo con los tres métodos
+            st.subheader("Daily Risk Metrics by Method")
+            portfolio_returns = returns.dot(optimal_weights)
+            scenarios = simulate_returns(mean, cov, RISK_SIMULATIONS, seed=0)
+            risk_methods = {
+                'Historical': historical_var_cvar(portfolio_returns, RISK_LEVELS),
+                'Parametric (normal)': parametric_var_cvar(portfolio_returns, RISK_LEVELS),
+                f'Monte Carlo ({RISK_SIMULATIONS:,} scenarios)': tuple(
+                    values[:, 0] for values in monte_carlo_var_cvar(scenarios, optimal_weights, RISK_LEVELS)),
+            }
+            risk_df = pd.DataFrame({'Method': list(risk_methods)})
+            for i, level in enumerate(RISK_LEVELS):
+                risk_df[f"VaR {level:.0%}"] = [f"{var[i]*100:.2f}%" for var, _ in risk_methods.values()]
+                risk_df[f"CVaR {level:.0%}"] = [f"{cvar[i]*100:.2f}%" for _, cvar in risk_methods.values()]
+            st.dataframe(risk_df)
+            
             # Visualizaciones
             st.subheader("Portfolio Visualization")
             
             # Efficient Frontier Plot
             fig = go.Figure()
-            fig.add_trace(go.Scatter(
+            fig.add_trace(go.Scattergl(
                 x=results['Volatility'],
                 y=results['Return'],
                 mode='markers',
@@ -172,20 +298,39 @@ if st.button("Run Optimization"):
                     showscale=True,
                     colorbar=dict(title="Sharpe Ratio")
                 ),
-                text=[f"Return: {r:.2%}<br>Vol: {v:.2%}<br>Sharpe: {s:.2f}" 
-                      for r,v,s in zip(results['Return'], 
-                                     results['Volatility'], 
-                                     results['Sharpe'])],
+                customdata=results['Sharpe'],
+                hovertemplate="Return: %{y:.2%}<br>Vol: %{x:.2%}<br>Sharpe: %{customdata:.2f}",
                 name="Portfolios"
             ))
             
-            # Añadir punto óptimo
+            # Frontera exacta y puntos óptimos
+            fig.add_trace(go.Scatter(
+                x=frontier['Volatility'],
+                y=frontier['Return'],
+                mode='lines',
+                line=dict(color='black', width=3),
+                name="Efficient Frontier (QP)"
+            ))
+            fig.add_trace(go.Scatter(
+                x=[results.iloc[random_idx]['Volatility']],
+                y=[results.iloc[random_idx]['Return']],
+                mode='markers',
+                marker=dict(size=13, color='orange', symbol='diamond'),
+                name="Best Random Portfolio"
+            ))
+            fig.add_trace(go.Scatter(
+                x=[min_variance['Volatility']],
+                y=[min_variance['Return']],
+                mode='markers',
+                marker=dict(size=15, color='blue', symbol='star'),
+                name="Min Variance (QP)"
+            ))
             fig.add_trace(go.Scatter(
-                x=[results.iloc[optimal_idx]['Volatility']],
-                y=[results.iloc[optimal_idx]['Return']],
+                x=[max_sharpe['Volatility']],
+                y=[max_sharpe['Return']],
                 mode='markers',
                 marker=dict(size=15, color='red', symbol='star'),
-                name="Optimal Portfolio"
+                name="Max Sharpe (QP)"
             ))
             
             fig.update_layout(
@@ -199,7 +344,7 @@ if st.button("Run Optimization"):
             st.plotly_chart(fig, use_container_width=True)
             
             # Historical Performance
-            st.subheader("Historical Performance Analysis")
+            st.subheader("Historical Performance Analysis (in-sample)")
             portfolio_returns = returns.dot(optimal_weights)
             cumulative_returns = (1 + portfolio_returns).cumprod()
             
@@ -241,6 +386,77 @@ if st.button("Run Optimization"):
             
             st.plotly_chart(fig3, use_container_width=True)
             
+            # Walk-forward: reoptimiza con datos pasados y mide fuera de muestra
+            st.subheader("Walk-Forward Backtest (out-of-sample)")
+            if len(returns) <= backtest_window + 1:
+                st.warning(f"The backtest needs more than {backtest_window + 1} days of data; "
+                           "extend the date range or shorten the estimation window.")
+            else:
+                start = time.perf_counter()
+                history, weights_history = walk_forward_backtest(
+                    returns, backtest_window, REBALANCE_FREQUENCIES[rebalance_label], rf_rate,
+                    BACKTEST_OBJECTIVES[backtest_objective], (min_weight, max_weight),
+                    transaction_cost, slippage, initial_capital, cov_method, n_factors)
+                backtest_time = time.perf_counter() - start
+                
+                oos_returns = history['Equity'] / history['Equity'].shift(1, fill_value=initial_capital) - 1
+                years = len(history) / 252
+                oos_return = (history['Equity'].iloc[-1] / initial_capital) ** (1 / years) - 1
+                oos_vol = oos_returns.std() * np.sqrt(252)
+                backtest_df = pd.DataFrame({
+                    'Metric': ['Annualized Return (net)', 'Volatility', 'Sharpe Ratio', 'Max Drawdown',
+                               'Rebalances', 'Total Turnover', 'Total Costs', 'Backtest Time'],
+                    'Value': [f"{oos_return*100:.2f}%",
+                              f"{oos_vol*100:.2f}%",
+                              f"{(oos_return - rf_rate) / oos_vol:.2f}",
+                              f"{history['Drawdown'].min()*100:.2f}%",
+                              f"{len(weights_history)}",
+                              f"{history['Turnover'].sum()*100:.1f}%",
+                              f"${history['Costs'].sum():,.2f}",
+                              f"{backtest_time:.2f} s"]
+                })
+                st.dataframe(backtest_df)
+                st.caption(f"Each window is estimated with the {covariance_model} covariance model.")
+                
+                # Curva in-sample en el mismo período, para comparar
+                in_sample = (1 + portfolio_returns.loc[history.index]).cumprod()
+                fig_bt = go.Figure()
+                fig_bt.add_trace(go.Scatter(
+                    x=history.index,
+                    y=history['Equity'],
+                    mode='lines',
+                    name='Walk-forward (out-of-sample, net of costs)'
+                ))
+                fig_bt.add_trace(go.Scatter(
+                    x=history.index,
+                    y=in_sample * initial_capital,
+                    mode='lines',
+                    line=dict(dash='dash'),
+                    name='Optimal weights (in-sample, no costs)'
+                ))
+                fig_bt.update_layout(
+                    title="Out-of-Sample Equity",
+                    xaxis_title="Date",
+                    yaxis_title="Portfolio Value ($)",
+                    height=400
+                )
+                st.plotly_chart(fig_bt, use_container_width=True)
+                
+                fig_bt_dd = go.Figure()
+                fig_bt_dd.add_trace(go.Scatter(
+                    x=history.index,
+                    y=history['Drawdown'],
+                    fill='tozeroy',
+                    name='Out-of-Sample Drawdown'
+                ))
+                fig_bt_dd.update_layout(
+                    title="Out-of-Sample Drawdown",
+                    xaxis_title="Date",
+                    yaxis_title="Drawdown",
+                    height=400
+                )
+                st.plotly_chart(fig_bt_dd, use_container_width=True)
+            
             # Risk Metrics Distribution
             st.subheader("Risk Metrics Distribution")
             col1, col2 = st.columns(2)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from portfolio_engine import TRADING_DAYS, annualized_moments, optimal_weights
+
+
+class RollingMoments:
+    """
+    Media y covarianza de una ventana móvil de retornos, actualizadas con
+    dos actualizaciones de rango 1 por día (entra una fila, sale otra) en
+    O(activos^2), en lugar de recalcular la ventana completa.
+    """
+
+    def __init__(self, n_assets):
+        self.count = 0
+        self.mean = np.zeros(n_assets)
+        self.m2 = np.zeros((n_assets, n_assets))
+
+    def add(self, row):
+        self.count += 1
+        delta = row - self.mean
+        self.mean += delta / self.count
+        self.m2 += np.outer(delta, row - self.mean)
+
+    def remove(self, row):
+        self.count -= 1
+        delta = row - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= np.outer(delta, row - self.mean)
+
+    def annualized(self):
+        """Retornos medios y covarianza muestral anualizados de la ventana"""
+        return self.mean * TRADING_DAYS, self.m2 / (self.count - 1) * TRADING_DAYS
+
+def walk_forward_backtest(returns, window=252, rebalance_every=21, rf_rate=0.0, objective='max_sharpe',
+                          bounds=(0.0, 1.0), transaction_cost=0.0, slippage=0.0, initial_capital=1.0,
+                          cov_method='sample', n_factors=5):
+    """
+    Backtest walk-forward: cada rebalance_every días se reoptimiza con los
+    últimos `window` retornos (solo datos ya observados) y los pesos se
+    aplican a los días siguientes. Entre rebalanceos los pesos derivan con
+    los precios.
+
+    Cada rebalanceo paga (transaction_cost + slippage) sobre el turnover
+    efectivo, sum|w_objetivo - w_derivados|, y el optimizador ve ese mismo
+    costo como penalización de turnover. La primera compra parte de
+    efectivo (turnover 1).
+
+    cov_method y n_factors eligen el estimador de covarianza de cada
+    ventana, como en annualized_moments. La muestral se mantiene con
+    RollingMoments; 'ledoit_wolf' y 'pca' se estiman sobre la ventana en
+    cada rebalanceo, porque la muestral es singular cuando hay más activos
+    que días en la ventana.
+
+    Devuelve un DataFrame por fecha fuera de muestra con Equity, Drawdown,
+    Turnover y Costs, y un DataFrame con los pesos de cada rebalanceo.
+    """
+    asset_returns = np.asarray(returns, dtype=float)
+    n_days, n_assets = asset_returns.shape
+    if n_days <= window + 1:
+        raise ValueError(f"Se necesitan más de {window + 1} días de datos para una ventana de {window} días")
+    cost_rate = transaction_cost + slippage
+
+    moments = None
+    if cov_method == 'sample':
+        moments = RollingMoments(n_assets)
+        for row in asset_returns[:window]:
+            moments.add(row)
+
+    equity = initial_capital
+    weights = np.zeros(n_assets)
+    target = None
+    equity_curve, turnovers, costs = [], [], []
+    rebalance_dates, rebalance_weights = [], []
+
+    for day in range(window, n_days):
+        # Rebalanceo al cierre del día anterior, con la ventana [day - window, day)
+        turnover = cost = 0.0
+        if (day - window) % rebalance_every == 0:
+            if moments is not None:
+                mean, cov = moments.annualized()
+            else:
+                mean, cov = annualized_moments(asset_returns[day - window:day], cov_method, n_factors)
+            current = weights if weights.sum() > 0 else None
+            target = optimal_weights(mean, cov, rf_rate, objective, bounds, current, cost_rate,
+                                     previous_weights=target)
+            turnover = np.abs(target - weights).sum()
+            cost = equity * turnover * cost_rate
+            equity -= cost
+            weights = target
+            rebalance_dates.append(returns.index[day])
+            rebalance_weights.append(target)
+
+        # Retorno fuera de muestra del día y deriva de los pesos
+        growth = weights * (1 + asset_returns[day])
+        day_return = growth.sum()
+        equity *= day_return
+        weights = growth / day_return
+
+        equity_curve.append(equity)
+        turnovers.append(turnover)
+        costs.append(cost)
+
+        if moments is not None:
+            moments.add(asset_returns[day])
+            moments.remove(asset_returns[day - window])
+
+    equity_curve = pd.Series(equity_curve, index=returns.index[window:])
+    history = pd.DataFrame({
+        'Equity': equity_curve,
+        'Drawdown': equity_curve / equity_curve.cummax() - 1,
+        'Turnover': turnovers,
+        'Costs': costs,
+    })
+    weights_history = pd.DataFrame(rebalance_weights, index=rebalance_dates, columns=returns.columns)
+    return history, weights_history
@@ -0,0 +1,505 @@
+import multiprocessing
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy.optimize import minimize
+from scipy.signal import lfilter
+from scipy.stats import norm, qmc, t as student_t
+
+
+# Trayectorias por lote independiente en los métodos de reducción de varianza
+BATCH_SIZE = 256
+
+VARIANCE_REDUCTION_METHODS = {
+    'Ninguna': 'none',
+    'Variables antitéticas': 'antithetic',
+    'Moment matching': 'moment_matching',
+    'Sobol (cuasi-aleatorio)': 'sobol',
+    'Variable de control': 'control_variate',
+}
+
+# Modelos de retornos: etiqueta -> modelo de fit_return_model
+RETURN_MODELS = {
+    'Normal i.i.d.': 'normal',
+    'Student-t': 'student_t',
+    'GARCH(1,1)': 'garch',
+    'Bootstrap por bloques': 'bootstrap',
+}
+
+# Métodos de reducción de varianza aplicables a cada modelo: los que
+# transforman normales estándar sirven para normal, Student-t y GARCH; la
+# variable de control necesita E[S_T] analítico (solo normal) y el bootstrap
+# remuestrea la historia, sin innovaciones que transformar.
+MODEL_VARIANCE_REDUCTION = {
+    'normal': ('none', 'antithetic', 'moment_matching', 'sobol', 'control_variate'),
+    'student_t': ('none', 'antithetic', 'moment_matching', 'sobol'),
+    'garch': ('none', 'antithetic', 'moment_matching', 'sobol'),
+    'bootstrap': ('none',),
+}
+
+# Políticas de rebalanceo: etiqueta -> policy de rebalance_equity
+REBALANCE_POLICIES = {
+    'Calendario': 'calendar',
+    'Banda de tolerancia': 'threshold',
+    'Sin rebalanceo (comprar y mantener)': 'none',
+}
+
+
+def calculate_transaction_costs(price, shares, commission=0.001, slippage=0.0001):
+    """
+    Calcula los costos de transacción
+    commission: 0.1% por operación
+    slippage: 0.01% por operación
+    """
+    commission_cost = price * shares * commission
+    slippage_cost = price * shares * slippage
+    return commission_cost + slippage_cost
+
+def rebalance_equity(prices, initial_investment, target_weight=1.0, policy='calendar', frequency=5,
+                     band=0.05, commission=0.001, slippage=0.0001):
+    """
+    Equity de una cartera activo + efectivo para un bloque de precios
+    (días x trayectorias), rebalanceada hacia target_weight en el activo.
+
+    policy: 'calendar' rebalancea cada `frequency` días, 'threshold' cuando
+    el peso del activo se aleja más de `band` del objetivo y 'none' solo
+    compra el día 0. Cada operación paga comisión y slippage sobre el
+    nominal efectivamente operado (calculate_transaction_costs), descontados
+    del efectivo. El bucle es sobre días; cada paso opera con todas las
+    trayectorias a la vez.
+
+    Devuelve la equity (días x trayectorias) y, por trayectoria, un dict con
+    costos totales, nominal operado y cantidad de rebalanceos.
+    """
+    n_days, n_paths = prices.shape
+    shares = np.full(n_paths, target_weight * initial_investment) / prices[0]
+    costs = calculate_transaction_costs(prices[0], shares, commission, slippage)
+    cash = initial_investment - shares * prices[0] - costs
+    traded = shares * prices[0]
+    rebalances = np.zeros(n_paths, dtype=np.int64)
+
+    equity = np.empty_like(prices)
+    equity[0] = shares * prices[0] + cash
+    for day in range(1, n_days):
+        price = prices[day]
+        stock = shares * price
+        total = stock + cash
+        if policy == 'calendar' and day % frequency == 0:
+            trade = np.ones(n_paths, dtype=bool)
+        elif policy == 'threshold':
+            trade = np.abs(stock / total - target_weight) > band
+        else:
+            trade = None
+
+        if trade is not None and trade.any():
+            delta = np.where(trade, target_weight * total / price - shares, 0.0)
+            cost = calculate_transaction_costs(price, np.abs(delta), commission, slippage)
+            shares += delta
+            cash -= delta * price + cost
+            costs += cost
+            traded += np.abs(delta) * price
+            # Solo cuenta como rebalanceo un nominal relevante: con target_weight = 1
+            # delta es ruido de punto flotante aunque no haya nada que operar
+            rebalances += trade & (np.abs(delta * price) > 1e-9 * total)
+        equity[day] = shares * price + cash
+
+    return equity, {'costs': costs, 'traded': traded, 'rebalances': rebalances}
+
+def simulate_paths(daily_returns, initial_price, initial_investment, rebalancing=None):
+    """
+    Calcula precios, equity, drawdowns y costos para un bloque (días x
+    trayectorias).
+
+    daily_returns son retornos logarítmicos simulados. La equity sale de
+    rebalance_equity con los parámetros de `rebalancing` (política, peso
+    objetivo, frecuencia o banda, comisión y slippage); precios y drawdowns
+    se calculan sobre el bloque completo.
+    """
+    simulations = np.cumsum(daily_returns, axis=0)
+    np.exp(simulations, out=simulations)
+    simulations *= initial_price
+
+    equity_curves, trading = rebalance_equity(simulations, initial_investment, **(rebalancing or {}))
+
+    # Drawdown desde el máximo acumulado a lo largo del eje temporal
+    drawdowns = np.maximum.accumulate(equity_curves, axis=0)
+    np.divide(equity_curves, drawdowns, out=drawdowns)
+    drawdowns -= 1
+
+    return simulations, equity_curves, drawdowns, trading
+
+class QuantileSketch:
+    """
+    Histograma por día con bordes fijos, para estimar cuantiles por día sin
+    guardar las trayectorias. Dos sketches con los mismos bordes se suman.
+    """
+
+    def __init__(self, pilot, bins=400, pad=0.5):
+        # Rango de cada día a partir de un bloque piloto, ampliado con un margen
+        lo = pilot.min(axis=1)
+        hi = pilot.max(axis=1)
+        width = np.maximum(hi - lo, 1e-12)
+        self.lo = lo - pad * width
+        self.step = (1 + 2 * pad) * width / bins
+        self.bins = bins
+        self.counts = np.zeros((len(lo), bins), dtype=np.int64)
+
+    def update(self, block):
+        n_days = len(self.lo)
+        idx = ((block - self.lo[:, None]) / self.step[:, None]).astype(np.int64)
+        np.clip(idx, 0, self.bins - 1, out=idx)
+        idx += (np.arange(n_days) * self.bins)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=n_days * self.bins)
+        self.counts += counts.reshape(n_days, self.bins)
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def quantiles(self, q):
+        """Cuantiles q (en [0, 1]) de cada día, interpolando dentro del bin: (len(q), días)"""
+        total = self.counts[0].sum()
+        cdf = np.cumsum(self.counts, axis=1) / total
+        result = []
+        for level in np.atleast_1d(q):
+            idx = np.minimum((cdf < level).sum(axis=1), self.bins - 1)
+            rows = np.arange(len(idx))
+            below = np.where(idx > 0, cdf[rows, np.maximum(idx - 1, 0)], 0.0)
+            mass = self.counts[rows, idx] / total
+            frac = np.divide(level - below, mass, out=np.full(len(idx), 0.5), where=mass > 0)
+            result.append(self.lo + self.step * (idx + np.clip(frac, 0, 1)))
+        return np.array(result)
+
+class DailyMoments:
+    """Media y varianza por día acumuladas por bloques (fusión de Chan)"""
+
+    def __init__(self, n_days):
+        self.count = 0
+        self.mean = np.zeros(n_days)
+        self.m2 = np.zeros(n_days)
+
+    def update(self, block):
+        other = DailyMoments(len(self.mean))
+        other.count = block.shape[1]
+        other.mean = block.mean(axis=1)
+        other.m2 = block.var(axis=1) * other.count
+        self.merge(other)
+
+    def merge(self, other):
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+class StreamingResult:
+    """
+    Resumen de un Monte Carlo procesado por bloques de trayectorias.
+
+    Guarda sketches de cuantiles por día (precio, equity y drawdown), media y
+    varianza por día de la equity, valores finales y drawdown máximo de cada
+    trayectoria (un float por trayectoria) y una muestra de trayectorias
+    completas para graficar. La memoria no depende de días x trayectorias.
+    """
+
+    SERIES = ('price', 'equity', 'drawdown')
+
+    def __init__(self, pilot, sample_size=100, bins=400):
+        self.sketches = {name: QuantileSketch(block, bins) for name, block in zip(self.SERIES, pilot)}
+        self.sample_size = sample_size
+        self.n_days = pilot[0].shape[0]
+        self._reset()
+
+    def _reset(self):
+        self.equity_moments = DailyMoments(self.n_days)
+        self.samples = {name: np.empty((self.n_days, 0)) for name in self.SERIES}
+        self.final_values = []
+        self.final_prices = []
+        self.max_drawdowns = []
+        self.chunk_sizes = []
+        self.trading = {}
+
+    def empty_copy(self):
+        """Resumen vacío con los mismos bordes de sketches, para fusionar luego"""
+        copy = StreamingResult.__new__(StreamingResult)
+        copy.__dict__.update(self.__dict__)
+        copy.sketches = {}
+        for name, sketch in self.sketches.items():
+            copy.sketches[name] = QuantileSketch.__new__(QuantileSketch)
+            copy.sketches[name].__dict__.update(sketch.__dict__)
+            copy.sketches[name].counts = np.zeros_like(sketch.counts)
+        copy._reset()
+        return copy
+
+    def update(self, block):
+        for name, series in zip(self.SERIES, block):
+            self.sketches[name].update(series)
+            # Las trayectorias son i.i.d.: las primeras ya son una muestra uniforme
+            missing = self.sample_size - self.samples[name].shape[1]
+            if missing > 0:
+                self.samples[name] = np.hstack([self.samples[name], series[:, :missing]])
+        simulations, equity_curves, drawdowns, trading = block
+        self.equity_moments.update(equity_curves)
+        self.final_values.append(equity_curves[-1].copy())
+        self.final_prices.append(simulations[-1].copy())
+        self.max_drawdowns.append(drawdowns.min(axis=0))
+        self.chunk_sizes.append(equity_curves.shape[1])
+        for name, values in trading.items():
+            self.trading.setdefault(name, []).append(values)
+
+    def merge(self, other):
+        for name in self.SERIES:
+            self.sketches[name].merge(other.sketches[name])
+            missing = self.sample_size - self.samples[name].shape[1]
+            if missing > 0:
+                self.samples[name] = np.hstack([self.samples[name], other.samples[name][:, :missing]])
+        self.equity_moments.merge(other.equity_moments)
+        self.final_values.extend(other.final_values)
+        self.final_prices.extend(other.final_prices)
+        self.max_drawdowns.extend(other.max_drawdowns)
+        self.chunk_sizes.extend(other.chunk_sizes)
+        for name, values in other.trading.items():
+            self.trading.setdefault(name, []).extend(values)
+
+    def bands(self, series, percentiles=(5, 25, 50, 75, 95)):
+        """Bandas de percentiles por día de 'price', 'equity' o 'drawdown'"""
+        return self.sketches[series].quantiles(np.asarray(percentiles) / 100)
+
+    def finals(self):
+        """Valores finales de equity y drawdowns máximos de todas las trayectorias"""
+        return np.concatenate(self.final_values), np.concatenate(self.max_drawdowns)
+
+    def trading_totals(self):
+        """Costos, nominal operado y rebalanceos de todas las trayectorias"""
+        return {name: np.concatenate(values) for name, values in self.trading.items()}
+
+def standard_normals(rng, size, n_days, method='none', batch_size=BATCH_SIZE):
+    """
+    Normales estándar (días x size) generadas en lotes independientes de
+    batch_size trayectorias, según el método de reducción de varianza:
+    - 'antithetic': cada lote es [z, -z]
+    - 'moment_matching': cada día del lote se reescala a media 0 y desvío 1
+    - 'sobol': cada lote es una secuencia de Sobol aleatorizada (QMC)
+    - 'none' y 'control_variate': normales i.i.d.
+    """
+    blocks = []
+    for start in range(0, size, batch_size):
+        n = min(batch_size, size - start)
+        if method == 'antithetic':
+            half = rng.standard_normal((n_days, (n + 1) // 2))
+            z = np.hstack([half, -half])[:, :n]
+        elif method == 'sobol':
+            sampler = qmc.Sobol(d=n_days, scramble=True, seed=rng)
+            with warnings.catch_warnings():
+                # Sobol avisa cuando n no es potencia de 2 (último lote)
+                warnings.simplefilter('ignore', UserWarning)
+                u = sampler.random(n)
+            z = norm.ppf(np.clip(u, 1e-12, 1 - 1e-12)).T
+        else:
+            z = rng.standard_normal((n_days, n))
+            if method == 'moment_matching' and n > 1:
+                z -= z.mean(axis=1, keepdims=True)
+                z /= z.std(axis=1, keepdims=True)
+        blocks.append(z)
+    return np.hstack(blocks)
+
+def normal_returns(rng, size, n_days, mu, sigma, method='none'):
+    """Bloque (días x size) de retornos logarítmicos normales"""
+    returns = standard_normals(rng, size, n_days, method)
+    returns *= sigma
+    returns += mu
+    return returns
+
+def student_t_returns(rng, size, n_days, mu, scale, df, method='none'):
+    """
+    Bloque (días x size) de retornos logarítmicos Student-t, como mezcla
+    normal: mu + scale * z * sqrt(df / chi2(df)). Las normales z salen de
+    standard_normals, así que la reducción de varianza se aplica igual.
+    """
+    returns = standard_normals(rng, size, n_days, method)
+    returns *= np.sqrt(df / rng.chisquare(df, size=returns.shape))
+    returns *= scale
+    returns += mu
+    return returns
+
+def garch_returns(rng, size, n_days, mu, omega, alpha, beta, variance, method='none'):
+    """
+    Bloque (días x size) de retornos logarítmicos GARCH(1,1):
+    r_t = mu + e_t, e_t = sqrt(s2_t) z_t, s2_t = omega + alpha e_{t-1}^2 + beta s2_{t-1},
+    partiendo de la varianza condicional `variance` del día siguiente a la
+    historia. La recursión es sobre días; cada paso actualiza todas las
+    trayectorias a la vez.
+    """
+    returns = standard_normals(rng, size, n_days, method)
+    s2 = np.full(size, variance)
+    for day in range(n_days):
+        returns[day] *= np.sqrt(s2)
+        s2 = omega + alpha * returns[day] ** 2 + beta * s2
+    returns += mu
+    return returns
+
+def bootstrap_returns(rng, size, n_days, history, block_size=20, method='none'):
+    """
+    Bloque (días x size) de retornos logarítmicos remuestreados de `history`
+    en bloques contiguos de block_size días (moving block bootstrap), que
+    conservan colas pesadas y la dependencia de corto plazo. Los índices de
+    todas las trayectorias se arman de una vez.
+    """
+    block_size = min(block_size, len(history))
+    n_blocks = -(-n_days // block_size)
+    starts = rng.integers(0, len(history) - block_size + 1, size=(n_blocks, 1, size))
+    index = (starts + np.arange(block_size)[:, None]).reshape(n_blocks * block_size, size)
+    return history[index[:n_days]]
+
+def garch_variance(residuals, alpha, beta):
+    """
+    Varianzas condicionales GARCH(1,1) de la historia con varianza objetivo
+    (omega = var * (1 - alpha - beta)), calculadas con un filtro lineal sobre
+    los residuos al cuadrado. Devuelve (varianzas, omega).
+    """
+    variance = residuals.var()
+    omega = variance * (1 - alpha - beta)
+    shocks = omega + alpha * np.concatenate([[variance], residuals[:-1] ** 2])
+    return lfilter([1.0], [1.0, -beta], shocks, zi=[beta * variance])[0], omega
+
+def fit_garch(returns):
+    """
+    Ajuste por máxima verosimilitud gaussiana de un GARCH(1,1) con varianza
+    objetivo. Devuelve (mu, omega, alpha, beta, varianza del día siguiente).
+    """
+    mu = returns.mean()
+    residuals = returns - mu
+
+    def negative_log_likelihood(params):
+        alpha, beta = params
+        if alpha < 0 or beta < 0 or alpha + beta >= 0.999:
+            return np.inf
+        s2, _ = garch_variance(residuals, alpha, beta)
+        return 0.5 * np.sum(np.log(s2) + residuals ** 2 / s2)
+
+    fit = minimize(negative_log_likelihood, x0=[0.05, 0.9], method='Nelder-Mead',
+                   options={'xatol': 1e-6, 'fatol': 1e-8})
+    alpha, beta = np.clip(fit.x, 0.0, 0.999) if np.isfinite(fit.fun) else (0.0, 0.0)
+    s2, omega = garch_variance(residuals, alpha, beta)
+    next_variance = omega + alpha * residuals[-1] ** 2 + beta * s2[-1]
+    return mu, omega, alpha, beta, next_variance
+
+def fit_return_model(returns, n_days, model='normal', method='none', block_size=20):
+    """
+    Ajusta `model` a los retornos logarítmicos históricos y devuelve
+    (draw_returns, params): draw_returns(rng, size) para run_streaming y los
+    parámetros ajustados.
+    - 'normal': media y desvío
+    - 'student_t': máxima verosimilitud de t.fit (mu, escala, grados de libertad)
+    - 'garch': GARCH(1,1) gaussiano (ver fit_garch)
+    - 'bootstrap': los propios retornos, remuestreados en bloques
+    """
+    returns = np.asarray(returns, dtype=float)
+    returns = returns[np.isfinite(returns)]
+    if model == 'student_t':
+        df, mu, scale = student_t.fit(returns)
+        params = {'mu': mu, 'scale': scale, 'df': df}
+        return partial(student_t_returns, n_days=n_days, method=method, **params), params
+    if model == 'garch':
+        params = dict(zip(('mu', 'omega', 'alpha', 'beta', 'variance'), fit_garch(returns)))
+        return partial(garch_returns, n_days=n_days, method=method, **params), params
+    if model == 'bootstrap':
+        params = {'block_size': block_size}
+        return partial(bootstrap_returns, n_days=n_days, history=returns, **params), params
+    params = {'mu': returns.mean(), 'sigma': returns.std(ddof=1)}
+    return partial(normal_returns, n_days=n_days, method=method, **params), params
+
+def gbm_final_price_mean(initial_price, n_days, mu, sigma):
+    """E[S_T] analítico para retornos logarítmicos N(mu, sigma) durante n_days"""
+    return initial_price * np.exp(n_days * (mu + sigma ** 2 / 2))
+
+def estimate_mean(result, method='none', control_mean=None, batch_size=BATCH_SIZE):
+    """
+    Media de los valores finales de equity y su error estándar.
+
+    Con 'control_variate' se usa el precio final como variable de control
+    (control_mean es su esperanza analítica). El error estándar usa pares en
+    'antithetic', medias de lote en 'moment_matching' y 'sobol' (cada lote es
+    una réplica independiente) y trayectorias i.i.d. en el resto.
+    """
+    values, _ = result.finals()
+    if method == 'control_variate':
+        prices = np.concatenate(result.final_prices)
+        cov = np.cov(prices, values)
+        values = values - cov[0, 1] / cov[0, 0] * (prices - control_mean)
+
+    # Límites de los lotes: se reinician en cada bloque
+    bounds, offset = [], 0
+    for size in result.chunk_sizes:
+        bounds.extend(range(offset, offset + size, batch_size))
+        offset += size
+    bounds.append(offset)
+
+    if method in ('moment_matching', 'sobol'):
+        samples = np.add.reduceat(values, bounds[:-1]) / np.diff(bounds)
+    elif method == 'antithetic':
+        samples = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            half = (hi - lo + 1) // 2
+            n_pairs = hi - lo - half
+            samples.append((values[lo:lo + n_pairs] + values[lo + half:lo + half + n_pairs]) / 2)
+        samples = np.concatenate(samples)
+    else:
+        samples = values
+
+    if len(samples) < 2:
+        return values.mean(), np.nan
+    return values.mean(), samples.std(ddof=1) / np.sqrt(len(samples))
+
+def _simulate_chunk(task):
+    """Simula un bloque con su propio Generator y devuelve su resumen parcial"""
+    template, seed, size, draw_returns, params = task
+    rng = np.random.default_rng(seed)
+    block = simulate_paths(draw_returns(rng, size), *params)
+    result = template.empty_copy()
+    result.update(block)
+    return result
+
+def run_streaming(draw_returns, n_paths, initial_price, initial_investment, rebalancing=None,
+                  chunk_size=10000, sample_size=100, bins=400, seed=None, workers=1):
+    """
+    Simula n_paths trayectorias en bloques de chunk_size y devuelve un
+    StreamingResult. draw_returns(rng, size) debe devolver un bloque
+    (días x size) de retornos logarítmicos usando el Generator recibido;
+    con workers > 1 debe poder serializarse (función de módulo o partial).
+    rebalancing son los parámetros de rebalance_equity.
+
+    Cada bloque usa su propio Generator, derivado de `seed` con
+    SeedSequence.spawn, y los resúmenes se fusionan en orden de bloque: con
+    la misma semilla y el mismo chunk_size el resultado es idéntico bit a
+    bit para cualquier cantidad de workers.
+    """
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    params = (initial_price, initial_investment, rebalancing)
+
+    # El primer bloque fija los bordes de los sketches que usan los demás
+    rng = np.random.default_rng(seeds[0])
+    pilot = simulate_paths(draw_returns(rng, sizes[0]), *params)
+    result = StreamingResult(pilot, sample_size, bins)
+    result.update(pilot)
+    del pilot
+
+    template = result.empty_copy()
+    tasks = [(template, seed, size, draw_returns, params)
+             for seed, size in zip(seeds[1:], sizes[1:])]
+    if workers > 1 and tasks:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            partials = pool.map(_simulate_chunk, tasks)
+            for partial_result in partials:
+                result.merge(partial_result)
+    else:
+        for task in tasks:
+            result.merge(_simulate_chunk(task))
+    return result
@@ -0,0 +1,554 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+from risk_engine import historical_var_cvar
+
+
+TRADING_DAYS = 252
+
+# Hasta esta cantidad de activos la frontera se resuelve con SLSQP; por encima,
+# con gradiente proximal (SLSQP es O(activos^3) por iteración)
+SLSQP_MAX_ASSETS = 50
+
+METRIC_COLUMNS = ['Return', 'Volatility', 'Sharpe', 'VaR_95', 'CVaR_95', 'Max_Drawdown']
+
+# Estado de cada activo en WeightProblem.active_set_solve: en un límite, sin
+# operar (w = current_weights) o libre, comprando o vendiendo
+AT_LOW, AT_HIGH, HOLD, BUY, SELL = range(5)
+STATE_SIDE = np.array([0.0, 0.0, 0.0, 1.0, -1.0])
+
+
+class FactorCovariance:
+    """
+    Covarianza en forma de bajo rango más diagonal: B B' + diag(specific),
+    con B (activos x factores). La varianza de un portafolio se calcula como
+    |B' w|^2 + sum(specific * w^2), en O(activos x factores) sin armar la
+    matriz completa.
+    """
+
+    def __init__(self, loadings, specific):
+        self.loadings = loadings
+        self.specific = specific
+
+    def dot(self, weights):
+        """Sigma @ w para un vector de pesos"""
+        return self.loadings @ (self.loadings.T @ weights) + self.specific * weights
+
+    def portfolio_variance(self, weights):
+        """Varianza de cada fila de una matriz de pesos (portafolios x activos)"""
+        return ((weights @ self.loadings) ** 2).sum(axis=1) + (weights ** 2) @ self.specific
+
+    def dense(self):
+        return self.loadings @ self.loadings.T + np.diag(self.specific)
+
+def covariance_dot(cov, weights):
+    """Sigma @ w para una matriz densa o un FactorCovariance"""
+    return cov.dot(weights) if isinstance(cov, FactorCovariance) else cov @ weights
+
+def portfolio_variance(cov, weights):
+    """Varianza de cada fila de una matriz de pesos (portafolios x activos)"""
+    if isinstance(cov, FactorCovariance):
+        return cov.portfolio_variance(weights)
+    return ((weights @ cov) * weights).sum(axis=1)
+
+def ledoit_wolf(centered):
+    """
+    Covarianza con shrinkage de Ledoit-Wolf hacia mu * I, con la intensidad
+    óptima estimada de los datos (retornos centrados, días x activos)
+    """
+    n_obs, n_assets = centered.shape
+    sample = centered.T @ centered / n_obs
+    mu = np.trace(sample) / n_assets
+    target_distance = ((sample - mu * np.eye(n_assets)) ** 2).sum()
+    # Varianza del estimador muestral: sum_t |x_t x_t' - S|^2 / n_obs^2
+    row_norms = (centered ** 2).sum(axis=1)
+    estimation = ((row_norms ** 2).sum() / n_obs - (sample ** 2).sum()) / n_obs
+    shrinkage = min(estimation, target_distance) / target_distance if target_distance > 0 else 1.0
+    cov = (1 - shrinkage) * sample
+    cov.flat[::n_assets + 1] += shrinkage * mu
+    return cov
+
+def pca_factor_covariance(centered, n_factors):
+    """
+    Modelo de factores estadísticos: los n_factors componentes principales
+    explican la parte común y el resto de la varianza de cada activo queda
+    como riesgo específico (diagonal)
+    """
+    n_obs = centered.shape[0]
+    n_factors = min(n_factors, min(centered.shape) - 1)
+    _, singular, components = np.linalg.svd(centered / np.sqrt(n_obs - 1), full_matrices=False)
+    loadings = components[:n_factors].T * singular[:n_factors]
+    total = (centered ** 2).sum(axis=0) / (n_obs - 1)
+    specific = np.maximum(total - (loadings ** 2).sum(axis=1), 1e-12)
+    return FactorCovariance(loadings, specific)
+
+def annualized_moments(returns, method='sample', n_factors=5):
+    """
+    Vector de retornos medios y covarianza anualizados.
+
+    method: 'sample' (matriz muestral), 'ledoit_wolf' (shrinkage) o 'pca'
+    (FactorCovariance con n_factors factores, para universos grandes).
+    """
+    asset_returns = np.asarray(returns, dtype=float)
+    mean = asset_returns.mean(axis=0)
+    centered = asset_returns - mean
+    if method == 'ledoit_wolf':
+        cov = ledoit_wolf(centered) * TRADING_DAYS
+    elif method == 'pca':
+        factors = pca_factor_covariance(centered, n_factors)
+        cov = FactorCovariance(factors.loadings * np.sqrt(TRADING_DAYS), factors.specific * TRADING_DAYS)
+    else:
+        cov = np.cov(asset_returns, rowvar=False) * TRADING_DAYS
+    return mean * TRADING_DAYS, cov
+
+def simulate_returns(mean, cov, n_sims, seed=None, horizon=1 / TRADING_DAYS):
+    """
+    Retornos normales multivariados de los activos (simulaciones x activos)
+    para un horizonte en años, a partir de momentos anualizados. Con
+    FactorCovariance se simulan los factores y el ruido específico.
+    """
+    rng = np.random.default_rng(seed)
+    if isinstance(cov, FactorCovariance):
+        shocks = (rng.standard_normal((n_sims, cov.loadings.shape[1])) @ cov.loadings.T
+                  + rng.standard_normal((n_sims, len(mean))) * np.sqrt(cov.specific))
+    else:
+        # Raíz por autovalores: tolera covarianzas muestrales singulares
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        root = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+        shocks = rng.standard_normal((n_sims, len(mean))) @ root.T
+    return mean * horizon + shocks * np.sqrt(horizon)
+
+def random_weights(n_portfolios, n_assets, seed=None):
+    """Matriz (portafolios x activos) de pesos aleatorios que suman 1"""
+    weights = np.random.default_rng(seed).random((n_portfolios, n_assets))
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights
+
+def portfolio_turnover(weights, current_weights, chunk_size=5000):
+    """Turnover sum|w - current_weights| de cada fila de una matriz de pesos, por bloques"""
+    turnover = np.empty(len(weights))
+    for start in range(0, len(weights), chunk_size):
+        block = slice(start, start + chunk_size)
+        turnover[block] = np.abs(weights[block] - current_weights).sum(axis=1)
+    return turnover
+
+def tail_metrics(port_returns, level=5):
+    """
+    VaR, CVaR y drawdown máximo de cada columna de una matriz de retornos
+    diarios (días x portafolios)
+    """
+    var, cvar = historical_var_cvar(port_returns, 1 - level / 100)
+    var, cvar = var[0], cvar[0]
+
+    cum_returns = np.cumprod(1 + port_returns, axis=0)
+    rolling_max = np.maximum.accumulate(cum_returns, axis=0)
+    max_drawdown = (cum_returns / rolling_max - 1).min(axis=0)
+    return var, cvar, max_drawdown
+
+def portfolio_metrics(returns, weights, rf_rate, chunk_size=5000, cov_method='sample', n_factors=5):
+    """
+    Retorno, volatilidad, Sharpe, VaR/CVaR 95% y drawdown máximo de muchos
+    portafolios a la vez.
+
+    La media y la covarianza se calculan una sola vez; retorno y volatilidad
+    salen de productos matriciales sobre los pesos (portafolios x activos) y
+    las métricas de cola, de la matriz de retornos diarios (días x
+    portafolios). Todo se arma por bloques de chunk_size portafolios para
+    acotar la memoria. cov_method y n_factors eligen el estimador de
+    covarianza (ver annualized_moments).
+    """
+    asset_returns = np.asarray(returns, dtype=float)
+    weights = np.atleast_2d(weights)
+    mean, cov = annualized_moments(asset_returns, cov_method, n_factors)
+
+    port_ret = weights @ mean
+    port_vol, var, cvar, max_drawdown = (np.empty(len(weights)) for _ in range(4))
+    for start in range(0, len(weights), chunk_size):
+        block = slice(start, start + chunk_size)
+        port_vol[block] = np.sqrt(portfolio_variance(cov, weights[block]))
+        var[block], cvar[block], max_drawdown[block] = tail_metrics(asset_returns @ weights[block].T)
+    sharpe = (port_ret - rf_rate) / port_vol
+
+    return pd.DataFrame(
+        np.column_stack([port_ret, port_vol, sharpe, var, cvar, max_drawdown]),
+        columns=METRIC_COLUMNS
+    )
+
+class WeightProblem:
+    """
+    Restricciones comunes de los problemas de optimización de pesos:
+    suma 1, límites (min_weight, max_weight) por activo y, si hay costos,
+    una penalización cost_rate * turnover sobre el retorno esperado.
+
+    El turnover sum|w - current_weights| se modela con variables auxiliares
+    t >= |w - current_weights|, así que el problema sigue siendo suave: las
+    variables son x = [w, t] y los costos se restan del retorno anualizado.
+    """
+
+    def __init__(self, mean, cov, bounds=(0.0, 1.0), current_weights=None, cost_rate=0.0):
+        self.mean = np.asarray(mean, dtype=float)
+        self.cov = cov if isinstance(cov, FactorCovariance) else np.asarray(cov, dtype=float)
+        self.n = len(self.mean)
+        low, high = bounds
+        if self.n * low > 1 + 1e-9 or self.n * high < 1 - 1e-9:
+            raise ValueError(f"Los límites ({low:.2%}, {high:.2%}) no admiten pesos que sumen 1 "
+                             f"con {self.n} activos")
+        self.current = None if current_weights is None else np.asarray(current_weights, dtype=float)
+        self.cost_rate = cost_rate if self.current is not None else 0.0
+        self.with_costs = self.cost_rate > 0
+
+        self.bounds = [(low, high)] * self.n
+        sum_jac = np.concatenate([np.ones(self.n), np.zeros(self.n if self.with_costs else 0)])
+        self.constraints = [{'type': 'eq', 'fun': lambda x: x[:self.n].sum() - 1, 'jac': lambda x: sum_jac}]
+        if self.with_costs:
+            self.bounds += [(0.0, None)] * self.n
+            eye = np.eye(self.n)
+            # t - (w - w0) >= 0  y  t + (w - w0) >= 0
+            above, below = np.hstack([-eye, eye]), np.hstack([eye, eye])
+            self.constraints += [
+                {'type': 'ineq', 'fun': lambda x: x[self.n:] - x[:self.n] + self.current,
+                 'jac': lambda x: above},
+                {'type': 'ineq', 'fun': lambda x: x[self.n:] + x[:self.n] - self.current,
+                 'jac': lambda x: below},
+            ]
+
+    def start(self, weights=None):
+        """Punto inicial x = [w, t] a partir de unos pesos (iguales por defecto)"""
+        weights = np.full(self.n, 1 / self.n) if weights is None else np.asarray(weights, dtype=float)
+        if not self.with_costs:
+            return weights.copy()
+        return np.concatenate([weights, np.abs(weights - self.current)])
+
+    def variance(self, x):
+        w = x[:self.n]
+        return w @ covariance_dot(self.cov, w)
+
+    def variance_jac(self, x):
+        return np.concatenate([2 * covariance_dot(self.cov, x[:self.n]), np.zeros(len(x) - self.n)])
+
+    def net_return(self, x):
+        return self.mean @ x[:self.n] - self.cost_rate * x[self.n:].sum()
+
+    def net_return_jac(self, x):
+        return np.concatenate([self.mean, np.full(len(x) - self.n, -self.cost_rate)])
+
+    def turnover(self, weights):
+        return 0.0 if self.current is None else np.abs(weights - self.current).sum()
+
+    def solve(self, fun, jac, x0, constraints=()):
+        result = minimize(fun, x0, jac=jac, method='SLSQP', bounds=self.bounds,
+                          constraints=self.constraints + list(constraints),
+                          options={'maxiter': 500, 'ftol': 1e-12})
+        return result.x
+
+    @property
+    def lipschitz(self):
+        """Cota de la constante de Lipschitz de 2 Sigma w (iteración de potencias)"""
+        if not hasattr(self, '_lipschitz'):
+            vector = np.full(self.n, 1 / np.sqrt(self.n))
+            for _ in range(100):
+                product = covariance_dot(self.cov, vector)
+                vector = product / np.linalg.norm(product)
+            self._lipschitz = 2.1 * vector @ covariance_dot(self.cov, vector)
+        return self._lipschitz
+
+    def project(self, target, penalty=0.0):
+        """
+        argmin 1/2 |w - target|^2 + penalty * |w - current_weights|_1 con
+        sum(w) = 1 y límites por activo. Para un multiplicador nu de la suma,
+        cada coordenada es el soft-threshold de target - nu recortado a los
+        límites, así que sum(w) es lineal por tramos en nu: se busca el tramo
+        entre quiebres que cruza 1 y se interpola exactamente.
+        """
+        low, high = self.bounds[0]
+
+        def candidate(nu):
+            shifted = target - nu
+            if penalty > 0:
+                gap = shifted - self.current
+                shifted = self.current + np.sign(gap) * np.maximum(np.abs(gap) - penalty, 0)
+            return np.clip(shifted, low, high)
+
+        kinks = [low, high]
+        if penalty > 0:
+            kinks += [low - penalty, low + penalty, high - penalty, high + penalty,
+                      self.current - penalty, self.current + penalty]
+        breaks = np.sort(np.concatenate([target - kink for kink in kinks]))
+
+        lower, upper = 0, len(breaks) - 1
+        while upper - lower > 1:
+            middle = (lower + upper) // 2
+            if candidate(breaks[middle]).sum() > 1:
+                lower = middle
+            else:
+                upper = middle
+        sum_lower, sum_upper = candidate(breaks[lower]).sum(), candidate(breaks[upper]).sum()
+        nu = breaks[lower]
+        if sum_lower > sum_upper:
+            nu += (sum_lower - 1) / (sum_lower - sum_upper) * (breaks[upper] - breaks[lower])
+        return candidate(nu)
+
+    def proximal_solve(self, risk_tolerance, weights, tol=1e-9, max_iter=5000):
+        """
+        min w' Sigma w - risk_tolerance * (mean' w - cost_rate * turnover)
+        por gradiente proximal acelerado (FISTA con reinicio adaptativo).
+        Solo usa productos Sigma w: con FactorCovariance cada iteración es
+        O(activos x factores). Devuelve x en el formato de summary.
+        """
+        step = 1 / self.lipschitz
+        penalty = step * risk_tolerance * self.cost_rate
+        weights = self.project(np.asarray(weights, dtype=float), 0.0)
+        point, momentum = weights, 1.0
+        for _ in range(max_iter):
+            gradient = 2 * covariance_dot(self.cov, point) - risk_tolerance * self.mean
+            updated = self.project(point - step * gradient, penalty)
+            change = updated - weights
+            if np.abs(change).max() < tol:
+                weights = updated
+                break
+            if (point - updated) @ change > 0:
+                # La dirección de impulso empeora: se reinicia desde el último punto
+                point, momentum = updated, 1.0
+            else:
+                next_momentum = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+                point = updated + (momentum - 1) / next_momentum * change
+                momentum = next_momentum
+            weights = updated
+        return self.start(weights)
+
+    def face_solve(self, state, objective, rf_rate):
+        """
+        Óptimo exacto con cada activo fijo o libre según `state` (ver
+        active_set_solve). Con los activos fijos, el retorno neto es lineal en
+        los libres (mean - cost_rate * lado), así que el mínimo de varianza con
+        suma 1 sale de un sistema lineal y el Sharpe máximo de esa cara es
+        w0 + u * var(w0) / exceso(w0), con w0 el de mínima varianza y u la
+        dirección de retorno dentro de la cara. Devuelve los pesos y el valor
+        marginal de cada activo (proporcional al gradiente del objetivo que se
+        maximiza), o None si la cara no tiene solución.
+        """
+        low, high = self.bounds[0]
+        cov = self.cov.dense() if isinstance(self.cov, FactorCovariance) else self.cov
+        current = self.current if self.with_costs else np.zeros(self.n)
+        free = state >= BUY
+        side = STATE_SIDE[state] * self.with_costs
+        weights = np.where(state == HOLD, current, np.array([low, high, 0.0, 0.0, 0.0])[state])
+        if not free.any():
+            return None
+        budget = 1 - weights[~free].sum()
+        try:
+            solved = np.linalg.solve(cov[np.ix_(free, free)], np.column_stack([
+                np.ones(free.sum()), cov[np.ix_(free, ~free)] @ weights[~free],
+                self.mean[free] - self.cost_rate * side[free]]))
+        except np.linalg.LinAlgError:
+            return None
+        ones, fixed, returns = solved.T
+        weights[free] = (budget + fixed.sum()) / ones.sum() * ones - fixed
+
+        if objective == 'min_variance':
+            return weights, -2 * cov @ weights
+
+        def excess(weights):
+            return self.mean @ weights - self.cost_rate * np.abs(weights - current).sum() - rf_rate
+
+        variance = weights @ cov @ weights
+        if excess(weights) <= 0 or variance <= 0:
+            return None
+        # En la cara el exceso es lineal: se usa el lado de cada activo libre, no |w - current|
+        start_excess = (self.mean - self.cost_rate * side) @ weights - rf_rate - self.cost_rate * (
+            np.abs(weights - current)[~free].sum() - side[free] @ current[free])
+        weights[free] += (returns - returns.sum() / ones.sum() * ones) * variance / start_excess
+        product = cov @ weights
+        return weights, self.mean - excess(weights) / (weights @ product) * product
+
+    def active_set_solve(self, objective, rf_rate, weights, max_iter=None):
+        """
+        Óptimo exacto de 'min_variance' o 'max_sharpe' por conjuntos activos,
+        sin SLSQP. Cada activo está en un límite, sin operar (HOLD, solo con
+        costos) o libre comprando o vendiendo, según los pesos de arranque; se
+        resuelve esa cara (face_solve) y se reasignan los activos que violan
+        las condiciones de KKT hasta que ninguno las viola. Con datos que
+        cambian poco (reoptimizaciones seguidas) suele bastar una o dos caras.
+        Devuelve None si no converge o si alguna cara no tiene solución.
+        """
+        low, high = self.bounds[0]
+        current = self.current if self.with_costs else np.zeros(self.n)
+        holdable = (current >= low) & (current <= high)
+        weights = np.asarray(weights, dtype=float)
+        state = np.where(weights >= current, BUY, SELL)
+        state[weights <= low + 1e-9] = AT_LOW
+        state[weights >= high - 1e-9] = AT_HIGH
+
+        for _ in range(max_iter or 2 * self.n + 5):
+            solved = self.face_solve(state, objective, rf_rate)
+            if solved is None:
+                return None
+            weights, marginal = solved
+            free = state >= BUY
+            side = STATE_SIDE[state] * self.with_costs
+            level = np.mean(marginal[free] - self.cost_rate * side[free])
+            tol = 1e-10 * (abs(level) + np.abs(marginal).max())
+            # Valor de subir o bajar cada peso, con el costo de operar o el ahorro de operar menos
+            up = marginal - level - self.cost_rate * np.where(weights >= current, 1, -1)
+            down = level - marginal - self.cost_rate * np.where(weights <= current, 1, -1)
+
+            updated = state.copy()
+            updated[free & (weights < low - 1e-12)] = AT_LOW
+            updated[free & (weights > high + 1e-12)] = AT_HIGH
+            if self.with_costs:
+                crossed = ((state == BUY) & (weights < current - 1e-12)) | \
+                          ((state == SELL) & (weights > current + 1e-12))
+                updated[crossed] = np.where(holdable[crossed], HOLD, np.where(state[crossed] == BUY, SELL, BUY))
+            rising = (state == AT_LOW) | (state == HOLD)
+            falling = (state == AT_HIGH) | (state == HOLD)
+            updated[rising & (up > tol)] = np.where(weights >= current, BUY, SELL)[rising & (up > tol)]
+            updated[falling & (down > tol)] = np.where(weights <= current, SELL, BUY)[falling & (down > tol)]
+            if np.array_equal(updated, state):
+                return weights
+            state = updated
+        return None
+
+    def summary(self, x, rf_rate):
+        """Pesos y métricas (retorno neto de costos, volatilidad, Sharpe, turnover)"""
+        weights = np.clip(x[:self.n], *self.bounds[0])
+        weights /= weights.sum()
+        net = self.mean @ weights - self.cost_rate * self.turnover(weights)
+        vol = np.sqrt(weights @ covariance_dot(self.cov, weights))
+        return {'weights': weights, 'Return': net, 'Volatility': vol,
+                'Sharpe': (net - rf_rate) / vol, 'Turnover': self.turnover(weights)}
+
+def min_variance_portfolio(problem, rf_rate, x0=None):
+    """Portafolio de mínima varianza dentro de las restricciones"""
+    x = problem.solve(problem.variance, problem.variance_jac, problem.start() if x0 is None else x0)
+    return problem.summary(x, rf_rate)
+
+def max_return_portfolio(problem, rf_rate):
+    """Portafolio de máximo retorno neto (extremo superior de la frontera)"""
+    x = problem.solve(lambda x: -problem.net_return(x), lambda x: -problem.net_return_jac(x),
+                      problem.start())
+    return problem.summary(x, rf_rate)
+
+def max_sharpe_portfolio(problem, rf_rate, x0=None):
+    """
+    Portafolio de Sharpe máximo. El Sharpe es pseudo-cóncavo donde el
+    exceso de retorno es positivo, así que el óptimo local al que llega SLSQP
+    desde un punto de la frontera es el global.
+    """
+    def negative_sharpe(x):
+        return -(problem.net_return(x) - rf_rate) / np.sqrt(problem.variance(x))
+
+    def negative_sharpe_jac(x):
+        vol = np.sqrt(problem.variance(x))
+        excess = problem.net_return(x) - rf_rate
+        return -(problem.net_return_jac(x) * vol - excess * problem.variance_jac(x) / (2 * vol)) / vol ** 2
+
+    x = problem.solve(negative_sharpe, negative_sharpe_jac, problem.start() if x0 is None else x0)
+    return problem.summary(x, rf_rate)
+
+def _proximal_frontier(problem, rf_rate, n_points):
+    """
+    Frontera por gradiente proximal para universos grandes: en lugar de
+    retornos objetivo recorre la tolerancia al riesgo en escala logarítmica
+    (cada solución es un punto de la frontera) y refina el Sharpe máximo con
+    búsqueda de sección áurea alrededor del mejor punto.
+    """
+    x = problem.proximal_solve(0.0, problem.start()[:problem.n])
+    points = [problem.summary(x, rf_rate)]
+    scale = problem.lipschitz / max(np.ptp(problem.mean), 1e-12)
+    tolerances = np.concatenate([[0.0], np.geomspace(1e-3 * scale, 1e3 * scale, n_points - 1)])
+    solutions = [x]
+    for tolerance in tolerances[1:]:
+        # Cada punto arranca desde el anterior (continuación a lo largo de la frontera)
+        x = problem.proximal_solve(tolerance, x[:problem.n])
+        solutions.append(x)
+        points.append(problem.summary(x, rf_rate))
+
+    best = int(np.argmax([point['Sharpe'] for point in points]))
+    lower = np.log(max(tolerances[max(best - 1, 0)], 1e-3 * scale))
+    upper = np.log(tolerances[min(best + 1, n_points - 1)])
+    start = solutions[best][:problem.n]
+
+    def evaluate(log_tolerance):
+        return problem.summary(problem.proximal_solve(np.exp(log_tolerance), start), rf_rate)
+
+    ratio = (np.sqrt(5) - 1) / 2
+    left, right = upper - ratio * (upper - lower), lower + ratio * (upper - lower)
+    left_point, right_point = evaluate(left), evaluate(right)
+    max_sharpe = points[best]
+    for _ in range(20):
+        max_sharpe = max(max_sharpe, left_point, right_point, key=lambda point: point['Sharpe'])
+        if left_point['Sharpe'] >= right_point['Sharpe']:
+            upper, right, right_point = right, left, left_point
+            left = upper - ratio * (upper - lower)
+            left_point = evaluate(left)
+        else:
+            lower, left, left_point = left, right, right_point
+            right = lower + ratio * (upper - lower)
+            right_point = evaluate(right)
+    return points, points[0], max_sharpe
+
+def efficient_frontier(mean, cov, rf_rate, n_points=50, bounds=(0.0, 1.0), current_weights=None,
+                       cost_rate=0.0):
+    """
+    Frontera eficiente exacta por programación cuadrática (SLSQP): mínima
+    varianza con retorno neto >= objetivo para n_points objetivos entre el
+    portafolio de mínima varianza y el de máximo retorno. Con más de
+    SLSQP_MAX_ASSETS activos se usa gradiente proximal (_proximal_frontier).
+
+    cov puede ser una matriz densa o un FactorCovariance. Devuelve la
+    frontera (DataFrame con Return, Volatility, Sharpe, Turnover), la matriz
+    de pesos de cada punto y los portafolios de mínima varianza y de Sharpe
+    máximo.
+    """
+    problem = WeightProblem(mean, cov, bounds, current_weights, cost_rate)
+    if problem.n > SLSQP_MAX_ASSETS:
+        points, min_variance, max_sharpe = _proximal_frontier(problem, rf_rate, n_points)
+    else:
+        min_variance = min_variance_portfolio(problem, rf_rate)
+        max_return = max_return_portfolio(problem, rf_rate)
+
+        points, x = [], problem.start(min_variance['weights'])
+        for target in np.linspace(min_variance['Return'], max_return['Return'], n_points):
+            target_constraint = {'type': 'ineq', 'fun': lambda x, target=target: problem.net_return(x) - target,
+                                 'jac': problem.net_return_jac}
+            # Cada punto arranca desde el anterior (continuación a lo largo de la frontera)
+            x = problem.solve(problem.variance, problem.variance_jac, x, [target_constraint])
+            points.append(problem.summary(x, rf_rate))
+
+        best = max(points, key=lambda point: point['Sharpe'])
+        max_sharpe = max_sharpe_portfolio(problem, rf_rate, problem.start(best['weights']))
+        if max_sharpe['Sharpe'] < best['Sharpe']:
+            max_sharpe = best
+
+    frontier = pd.DataFrame([{k: v for k, v in point.items() if k != 'weights'} for point in points])
+    return frontier, np.array([point['weights'] for point in points]), min_variance, max_sharpe
+
+def optimal_weights(mean, cov, rf_rate, objective='max_sharpe', bounds=(0.0, 1.0), current_weights=None,
+                    cost_rate=0.0, previous_weights=None):
+    """
+    Pesos de Sharpe máximo ('max_sharpe') o de mínima varianza
+    ('min_variance') sin trazar la frontera. previous_weights sirve de
+    arranque en caliente cuando se reoptimiza con datos parecidos, como en
+    un backtest: con hasta SLSQP_MAX_ASSETS activos se prueba primero
+    WeightProblem.active_set_solve desde esos pesos y SLSQP queda como
+    respaldo. La penalización por turnover solo afecta al retorno, así que
+    no se aplica al portafolio de mínima varianza.
+    """
+    if objective == 'min_variance':
+        current_weights = None
+    problem = WeightProblem(mean, cov, bounds, current_weights, cost_rate)
+    if problem.n > SLSQP_MAX_ASSETS:
+        _, min_variance, max_sharpe = _proximal_frontier(problem, rf_rate, 10)
+        return (max_sharpe if objective == 'max_sharpe' else min_variance)['weights']
+
+    weights = problem.active_set_solve(objective, rf_rate,
+                                       np.full(problem.n, 1 / problem.n) if previous_weights is None
+                                       else previous_weights)
+    if weights is not None:
+        return weights
+
+    x0 = None if previous_weights is None else problem.start(previous_weights)
+    if objective == 'min_variance':
+        return min_variance_portfolio(problem, rf_rate, x0)['weights']
+    return max_sharpe_portfolio(problem, rf_rate, x0)['weights']
@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+import yfinance as yf
+
+
+def yahoo_prices(tickers, start_date, end_date, source=None):
+    """
+    Precios ajustados de todos los tickers en una sola descarga de Yahoo
+    Finance (yfinance reparte el pedido en hilos). Devuelve un DataFrame
+    (fechas x tickers); los tickers sin datos no aparecen.
+    """
+    data = yf.download(list(tickers), start=start_date, end=end_date, auto_adjust=False,
+                       group_by='column', threads=True, progress=False)
+    prices = data['Adj Close']
+    if isinstance(prices, pd.Series):
+        prices = prices.to_frame(tickers[0])
+    return prices.dropna(axis=1, how='all')
+
+def read_fixture(path):
+    """Lee un fixture local de precios (CSV o Parquet) con fechas como índice y un ticker por columna"""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        prices = pd.read_parquet(path)
+    else:
+        prices = pd.read_csv(path, index_col=0, parse_dates=True)
+    prices.columns = prices.columns.str.upper()
+    return prices
+
+def save_fixture(prices, path):
+    """Guarda precios descargados como fixture para reproducirlos sin red"""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        prices.to_parquet(path)
+    else:
+        prices.to_csv(path)
+
+def fixture_prices(tickers, start_date, end_date, source):
+    """Precios desde un fixture local, recortados al rango de fechas y sin acceso a la red"""
+    prices = read_fixture(source)
+    prices = prices.loc[pd.Timestamp(start_date):pd.Timestamp(end_date) - pd.Timedelta(days=1)]
+    available = [ticker for ticker in tickers if ticker.upper() in prices.columns]
+    return prices[[ticker.upper() for ticker in available]].set_axis(available, axis=1)
+
+# Proveedores disponibles: nombre -> función (tickers, start, end, source) -> precios
+PRICE_PROVIDERS = {
+    'Yahoo Finance': yahoo_prices,
+    'Fixture local': fixture_prices,
+}
+
+def _cache_path(cache_dir, provider, ticker, start_date, end_date):
+    name = f"{provider}_{ticker}_{pd.Timestamp(start_date):%Y%m%d}_{pd.Timestamp(end_date):%Y%m%d}.pkl"
+    return os.path.join(cache_dir, name.replace(' ', '_'))
+
+def get_prices(tickers, start_date, end_date, provider='Yahoo Finance', source=None, cache_dir=None):
+    """
+    Precios ajustados de varios tickers alineados en un índice común.
+
+    Con cache_dir, cada ticker se guarda en disco por (proveedor, fechas):
+    solo se piden al proveedor los que faltan, en un único pedido, y el
+    resultado se arma con un solo concat. Devuelve (precios, tickers sin datos).
+    """
+    cached, missing = {}, []
+    for ticker in tickers:
+        path = cache_dir and _cache_path(cache_dir, provider, ticker, start_date, end_date)
+        if path and os.path.exists(path):
+            cached[ticker] = pd.read_pickle(path)
+        else:
+            missing.append(ticker)
+
+    if missing:
+        fetched = PRICE_PROVIDERS[provider](missing, start_date, end_date, source)
+        for ticker in missing:
+            if ticker in fetched.columns:
+                cached[ticker] = fetched[ticker].dropna()
+                if cache_dir:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    cached[ticker].to_pickle(_cache_path(cache_dir, provider, ticker, start_date, end_date))
+
+    available = [ticker for ticker in tickers if ticker in cached]
+    if not available:
+        return pd.DataFrame(), list(tickers)
+    prices = pd.concat([cached[ticker].rename(ticker) for ticker in available], axis=1, join='inner')
+    return prices, [ticker for ticker in tickers if ticker not in cached]
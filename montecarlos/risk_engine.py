@@ -0,0 +1,88 @@
+import numpy as np
+from scipy.stats import norm
+
+
+def _as_levels(confidence):
+    return np.atleast_1d(np.asarray(confidence, dtype=float))
+
+def historical_var_cvar(returns, confidence=0.95, chunk_size=5000):
+    """
+    VaR y CVaR históricos de cada columna de `returns` (observaciones x
+    portafolios, o un vector) para uno o varios niveles de confianza.
+
+    El VaR es el percentil (1 - confianza) con interpolación lineal, igual
+    que np.percentile, pero con np.partition: un pivote por nivel separa la
+    cola, sin ordenar todo. El CVaR es el promedio de la cola que queda a la
+    izquierda del VaR.
+    Devuelve dos arreglos (niveles x portafolios), o (niveles,) si `returns`
+    es un vector.
+    """
+    returns = np.asarray(returns, dtype=float)
+    vector = returns.ndim == 1
+    returns = returns.reshape(len(returns), -1)
+    levels = _as_levels(confidence)
+    n_obs = len(returns)
+
+    # El percentil cae entre los estadísticos de orden count - 1 y count
+    position = (n_obs - 1) * (1 - levels)
+    # Redondeo de punto flotante: (21 - 1) * (1 - 0.9) da 1.9999999999999996, no 2
+    nearest = np.round(position)
+    position = np.where(np.abs(position - nearest) < 1e-9, nearest, position)
+    count = np.floor(position).astype(int) + 1
+    fraction = position - (count - 1)
+    kth = np.unique(np.minimum(count, n_obs - 1))
+
+    var = np.empty((len(levels), returns.shape[1]))
+    cvar = np.empty_like(var)
+    for start in range(0, returns.shape[1], chunk_size):
+        block = slice(start, start + chunk_size)
+        # Un solo pivote por nivel: las primeras `count` filas son las peores observaciones
+        ordered = np.partition(returns[:, block], kth, axis=0)
+        for i, (k, frac) in enumerate(zip(count, fraction)):
+            tail = ordered[:k]
+            worst = tail.max(axis=0)
+            var[i, block] = worst if k == n_obs else worst * (1 - frac) + ordered[k] * frac
+            cvar[i, block] = tail.mean(axis=0)
+
+    return (var[:, 0], cvar[:, 0]) if vector else (var, cvar)
+
+def parametric_var_cvar(returns, confidence=0.95):
+    """
+    VaR y CVaR paramétricos (normales) a partir de la media y el desvío de
+    cada columna. Misma forma de salida que historical_var_cvar.
+    """
+    returns = np.asarray(returns, dtype=float)
+    vector = returns.ndim == 1
+    returns = returns.reshape(len(returns), -1)
+    alpha = 1 - _as_levels(confidence)[:, None]
+    mean = returns.mean(axis=0)
+    std = returns.std(axis=0, ddof=1)
+    z = norm.ppf(alpha)
+    var = mean + std * z
+    cvar = mean - std * norm.pdf(z) / alpha
+    return (var[:, 0], cvar[:, 0]) if vector else (var, cvar)
+
+def monte_carlo_var_cvar(simulated_returns, weights, confidence=0.95, chunk_size=5000):
+    """
+    VaR y CVaR de muchos portafolios sobre retornos simulados de los activos
+    (simulaciones x activos), con cualquier generador de escenarios. Los
+    retornos de los portafolios (simulaciones x portafolios) se arman por
+    bloques de chunk_size portafolios.
+    """
+    weights = np.atleast_2d(weights)
+    levels = _as_levels(confidence)
+    var = np.empty((len(levels), len(weights)))
+    cvar = np.empty_like(var)
+    for start in range(0, len(weights), chunk_size):
+        block = slice(start, start + chunk_size)
+        var[:, block], cvar[:, block] = historical_var_cvar(simulated_returns @ weights[block].T, levels)
+    return var, cvar
+
+def confidence_intervals(values, confidence_levels):
+    """
+    Intervalos centrales de `values` para varios niveles de confianza (en %),
+    con una sola llamada a np.quantile. Devuelve (mínimos, máximos).
+    """
+    tails = (100 - np.asarray(confidence_levels, dtype=float)) / 200
+    bounds = np.quantile(values, np.concatenate([tails, 1 - tails]))
+    return bounds[:len(tails)], bounds[len(tails):]
@@ -8,6 +8,8 @@ import requests
 from bs4 import BeautifulSoup
 import matplotlib.pyplot as plt
 from subscription_manager import save_feedback
+from simulation_backend import simulate_gbm_paths
+import os
 
 @st.cache_data
 def get_option_data(ticker, expiration):
@@ -218,22 +220,22 @@ def display_simulations(ticker, current_price):
     # Monte Carlo simulation parameters
     days = 252  # One trading year
     simulations = 1000
+    seed = st.sidebar.number_input("Semilla", min_value=0, value=42)
+    workers = st.sidebar.number_input("Procesos en paralelo", min_value=1,
+                                      max_value=os.cpu_count() or 1, value=1)
     
     # Calculate historical volatility
     returns = ticker.history(period="1y")['Close'].pct_change().dropna()
     vol = returns.std() * np.sqrt(252)
     
-    # Run simulation
-    dt = 1/252
-    paths = np.exp(
-        (0 - 0.5 * vol ** 2) * dt +
-        vol * np.sqrt(dt) * 
-        np.random.normal(0, 1, size=(simulations, days))
-    ).cumprod(axis=1) * current_price
+    # Run simulation (reproducible for a given seed, whatever the worker count)
+    paths = simulate_gbm_paths(current_price, vol, days, simulations,
+                               seed=int(seed), workers=int(workers))
     
     # Plot results
+    rng = np.random.default_rng(int(seed))
     fig = go.Figure()
-    for path in paths[np.random.choice(simulations, 100)]:
+    for path in paths[rng.choice(simulations, 100)]:
         fig.add_trace(go.Scatter(y=path, mode='lines', opacity=0.1, showlegend=False))
     
     percentiles = np.percentile(paths, [5, 50, 95], axis=0)
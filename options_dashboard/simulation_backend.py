@@ -0,0 +1,36 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def _gbm_chunk(task):
+    """Simulate one chunk of GBM paths with its own Generator."""
+    seed, size, current_price, vol, days, dt = task
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal(size=(size, days))
+    return np.exp(
+        (0 - 0.5 * vol ** 2) * dt +
+        vol * np.sqrt(dt) * shocks
+    ).cumprod(axis=1) * current_price
+
+def simulate_gbm_paths(current_price, vol, days, simulations, seed=None, workers=1,
+                       chunk_size=250, dt=1/252):
+    """
+    Simulate GBM paths (simulations x days) in chunks of chunk_size.
+
+    Each chunk gets an independent Generator spawned from `seed` with
+    SeedSequence.spawn and chunks are stacked in order, so a given seed
+    gives bit-identical paths for any number of workers.
+    """
+    sizes = [min(chunk_size, simulations - start) for start in range(0, simulations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, size, current_price, vol, days, dt) for s, size in zip(seeds, sizes)]
+
+    if workers > 1 and len(tasks) > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            chunks = list(pool.map(_gbm_chunk, tasks))
+    else:
+        chunks = [_gbm_chunk(task) for task in tasks]
+    return np.vstack(chunks)